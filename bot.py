@@ -9,20 +9,34 @@ from dotenv import load_dotenv
 from pycord.multicog import apply_multicog
 
 import static.common as com
+import static.members as members
+import static.channels as channels
 import data.databaseapi as db
+import data.configapi as configapi
+import checks.IsMemberVisible as member_visible
 
 logging.basicConfig(level=logging.INFO)
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 DEBUG = os.getenv('DEBUG')
+# Privileged intent, must also be enabled for the application in the developer portal
+MEMBERS_INTENT = os.getenv('MEMBERS_INTENT')
 
 if DEBUG:
     from asyncio import set_event_loop_policy, WindowsSelectorEventLoopPolicy
     set_event_loop_policy(WindowsSelectorEventLoopPolicy())
 
+class Urnby(discord.Bot):
+    async def close(self):
+        await super().close()
+        await db.close_database()
+
 intents = discord.Intents.default()
-UrnbyBot = discord.Bot(intents=intents)
+if MEMBERS_INTENT:
+    # Chunking fills the gateway member cache at startup so member lookups rarely need REST
+    intents.members = True
+UrnbyBot = Urnby(intents=intents, chunk_guilds_at_startup=bool(MEMBERS_INTENT))
 
 cogs_list = [
     'clocks',
@@ -31,12 +45,37 @@ cogs_list = [
     'dashboard',
     'tod',
     'channel_stats',
+    'backups',
 ]
 
 
+@UrnbyBot.listen()
+async def on_member_update(before, after):
+    members.invalidate(after.guild.id, after.id)
+
+@UrnbyBot.listen()
+async def on_member_remove(member):
+    members.invalidate(member.guild.id, member.id)
+
+# Cached channel visibility decisions depend on channel overwrites and role permissions
+async def on_visibility_change(*args):
+    member_visible.invalidate(args[-1].guild.id)
+
+@UrnbyBot.listen()
+async def on_guild_channel_update(before, after):
+    channels.invalidate(after.guild.id, after.id)
+
+@UrnbyBot.listen()
+async def on_guild_channel_delete(channel):
+    channels.invalidate(channel.guild.id, channel.id)
+
+for event in ['on_guild_channel_update', 'on_guild_channel_delete', 'on_guild_role_update', 'on_guild_role_delete']:
+    UrnbyBot.add_listener(on_visibility_change, event)
+configapi.subscribe(member_visible.invalidate)
+
 @UrnbyBot.event
 async def on_ready():
-    await db.init_database()
+    await configapi.load()
     print(f"{com.get_current_iso()} - {UrnbyBot.user} is online!", flush=True)
 '''
 @UrnbyBot.command()
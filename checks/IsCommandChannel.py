@@ -1,18 +1,14 @@
 from discord.ext import commands
-import json
+import data.configapi as configapi
 
 class NotCommandChannel(commands.CheckFailure):
     pass
 
-@staticmethod
-def get_config():
-    return json.load(open('data/config.json', 'r', encoding='utf-8'))
-
 def is_command_channel():
     async def predicate(ctx):
         if ctx.guild is None:
             return NotCommandChannel()
-        config = get_config()
+        config = configapi.get_config()
         if ctx.channel_id in config[str(ctx.guild.id)]['command_channels']:
             return True
         raise NotCommandChannel()
@@ -1,22 +1,19 @@
 from discord.ext import commands
 import discord 
-import json
+import data.configapi as configapi
+import static.members as members
 
 class NotMember(commands.CheckFailure):
     pass
 
-@staticmethod
-def get_config():
-    return json.load(open('data/config.json', 'r', encoding='utf-8'))
-
 def is_member():
     async def predicate(ctx):
         if ctx.guild is None:
             return False
-        allowed_member_roles = get_config()[str(ctx.guild.id)]['member_roles']
+        allowed_member_roles = configapi.get_config()[str(ctx.guild.id)]['member_roles']
         
-        author_member = await ctx.guild.fetch_member(ctx.author.id)
-        author_roles = author_member.roles
+        author_member = await members.get_member(ctx.guild, ctx.author.id, ctx)
+        author_roles = author_member.roles if author_member else []
         for role in author_roles:
             if role.id in allowed_member_roles:
                 return True
@@ -1,13 +1,30 @@
 from discord.ext import commands
 import discord 
-import json
+import data.configapi as configapi
 
 class NotMemberVisible(commands.CheckFailure):
     pass
 
-@staticmethod
-def get_config():
-    return json.load(open('data/config.json', 'r', encoding='utf-8'))
+REQUIRED_PERMS = discord.Permissions(read_messages=True, read_message_history=True)
+
+# guild_id -> {(channel_id, frozenset(member_roles)): visible}, cleared by channel/role events and member_roles config changes
+_visibility = {}
+
+def invalidate(guild_id=None, key=None):
+    if key is not None and key != 'member_roles':
+        return
+    if guild_id is None:
+        _visibility.clear()
+        return
+    _visibility.pop(int(guild_id), None)
+
+def channel_visible(guild, channel, member_roles) -> bool:
+    for role in member_roles:
+        _role = guild.get_role(role)
+        channel_perms = channel.permissions_for(_role)
+        if not channel_perms.is_superset(REQUIRED_PERMS):
+            return False
+    return True
 
 def is_member_visible():
     async def predicate(ctx):
@@ -15,17 +32,13 @@ def is_member_visible():
         if ctx.guild is None:
             raise NotMemberVisible
         
-        member_roles = get_config()[str(ctx.guild.id)]['member_roles']
-        for role in member_roles:
-            _role = ctx.guild.get_role(role)
-            channel_perms = ctx.channel.permissions_for(_role)
-            
-            req_perms = discord.Permissions.none()
-            req_perms.update(read_messages = True) 
-            req_perms.update(read_message_history = True)
-            if not channel_perms.is_superset(req_perms):
-                raise NotMemberVisible
-            
+        member_roles = configapi.get_config()[str(ctx.guild.id)]['member_roles']
+        guild_cache = _visibility.setdefault(ctx.guild.id, {})
+        key = (ctx.channel.id, frozenset(member_roles))
+        visible = guild_cache.get(key)
+        if visible is None:
+            visible = guild_cache[key] = channel_visible(ctx.guild, ctx.channel, member_roles)
+        if not visible:
+            raise NotMemberVisible
         return True
     return commands.check(predicate)
-   
\ No newline at end of file
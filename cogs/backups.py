@@ -0,0 +1,64 @@
+# Builtin
+import os
+
+# External
+import discord
+from discord.ext import commands, tasks
+from pycord.multicog import add_to_group
+
+# Internal
+import static.common as com
+import data.backup as backup
+from checks.IsAdmin import is_admin, NotAdmin
+
+BACKUP_INTERVAL = int(os.getenv('DB_BACKUP_INTERVAL', 60))
+
+class Backups(commands.Cog):
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.failures = 0
+        self.snapshotter.start()
+        print('Initilization on backups complete')
+
+    def cog_unload(self):
+        self.snapshotter.cancel()
+
+    @tasks.loop(minutes=BACKUP_INTERVAL)
+    async def snapshotter(self):
+        try:
+            await backup.create_snapshot()
+        except Exception as err:
+            self.failures += 1
+            print(f"{com.get_current_iso()} - Database snapshot failed ({self.failures} failures) - {err}", flush=True)
+
+    @snapshotter.before_loop
+    async def before_snapshotter(self):
+        await self.bot.wait_until_ready()
+
+    @add_to_group('admin')
+    @commands.slash_command(name='backup', description='Show the latest database snapshot or take one now')
+    @is_admin()
+    async def _adminbackup(self, ctx, action: discord.Option(str, name="action", choices=['Status', 'Run'], default='Status')):
+        if action == 'Run':
+            await ctx.defer(ephemeral=True)
+            try:
+                stats = await backup.create_snapshot()
+            except Exception as err:
+                await ctx.send_followup(content=f'Snapshot failed - {err}', ephemeral=True)
+                return
+            await ctx.send_followup(content=f"Snapshot taken in {stats['duration']}s, {round(stats['size']/1024)} KB", ephemeral=True)
+            return
+        snapshots = backup.list_snapshots()
+        if not snapshots:
+            await ctx.send_response(content=f'No snapshots yet, one is taken every {BACKUP_INTERVAL} minutes', ephemeral=True)
+            return
+        content = f'{len(snapshots)} snapshots kept (retention {backup.BACKUP_RETENTION}), latest from <t:{backup.snapshot_timestamp(snapshots[-1])}:R>'
+        if backup.last_backup:
+            content += f"\nLast run took {backup.last_backup['duration']}s, {round(backup.last_backup['size']/1024)} KB"
+        if self.failures:
+            content += f'\n{self.failures} snapshots have failed since startup'
+        await ctx.send_response(content=content, ephemeral=True)
+
+def setup(bot):
+    bot.add_cog(Backups(bot))
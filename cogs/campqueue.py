@@ -10,6 +10,8 @@ from pycord.multicog import add_to_group
 # Internal
 import data.databaseapi as db
 import static.common as com
+import static.members as members
+import static.locks as locks
 from checks.IsAdmin import is_admin, NotAdmin
 from checks.IsCommandChannel import is_command_channel, NotCommandChannel
 from checks.IsMemberVisible import is_member_visible, NotMemberVisible
@@ -152,18 +154,23 @@ class CampQueue(commands.Cog):
             'in_timestamp': com.get_current_timestamp(),
         }
         
-        if not await db.get_session(ctx.guild.id):
+        # Session end clears the queue, so the session check and insert happen under the guild lock
+        async with locks.user(ctx.guild.id, userid), locks.guild(ctx.guild.id):
+            session = await db.get_session(ctx.guild.id)
+            active = session and await db.is_user_active(ctx.guild.id, userid)
+            added = None
+            if session and not active:
+                added = await db.add_replacement(ctx.guild.id, rep)
+        if not session:
             await ctx.send_response(content=f'There is no session to queue up for')
             return
-
-        if await db.is_user_active(ctx.guild.id, userid):
+        if active:
             await ctx.send_response(content=f'{display_name} is already clocked in')
             return
-        
-        added = await db.add_replacement(ctx.guild.id, rep)
         if not added:
             await ctx.send_response(content=f'{display_name} is already in queue')
             return
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'rep_add')
         await ctx.send_response(content=f'{display_name} Successfully added to replacement queue')
         
     
@@ -176,10 +183,12 @@ class CampQueue(commands.Cog):
         userid, display_name = await get_userid_and_name(ctx, userid)
         if not userid:
             return
-        removed = await db.remove_replacement(ctx.guild.id, userid)
+        async with locks.user(ctx.guild.id, userid):
+            removed = await db.remove_replacement(ctx.guild.id, userid)
         if removed is None:
             await ctx.send_response(content=f'User is not in queue')
             return
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'rep_remove')
         await ctx.send_response(content=f'{display_name} Successfully removed from replacement queue')    
     
     '''
@@ -215,10 +224,12 @@ class CampQueue(commands.Cog):
     @is_admin()
     @is_command_channel()
     async def _adminrepclear(self, ctx):
-        res = await db.clear_replacement_queue(ctx.guild.id)
+        async with locks.guild(ctx.guild.id):
+            res = await db.clear_replacement_queue(ctx.guild.id)
         if res is None:
             await ctx.send_response(content=f'Problem occured while clearing camp queue.')
             return
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'rep_clear')
         await ctx.send_response(content=f'Camp Queue cleared.')
 '''
 async def get_userid_and_name(ctx, userid):
@@ -240,14 +251,11 @@ async def get_userid_and_name(ctx, param) -> int:
     # Try userid for int interpretation
     ret = {'result': None, 'type': MemberQueryResult.QUERY_FAILED}
     try:
-        int(param)
-        res = await ctx.guild.fetch_member(int(param))
-        ret = {'result': res, 'type': MemberQueryResult.FOUND}
+        res = await members.get_member(ctx.guild, int(param), ctx)
+        ret = {'result': res, 'type': MemberQueryResult.FOUND if res else MemberQueryResult.ID_NOT_FOUND}
     except (ValueError, TypeError) as err:
         # Failed int parsing
         pass 
-    except discord.errors.NotFound:
-        ret = {'result': None, 'type': MemberQueryResult.ID_NOT_FOUND}
     if not ret['result']:
         # try querying string for member
         try:
@@ -255,6 +263,7 @@ async def get_userid_and_name(ctx, param) -> int:
             if len(res) == 0:
                 ret = {'result': None, 'type': MemberQueryResult.ID_NOT_FOUND}
             elif len(res) == 1:
+                members.remember(res[0])
                 ret = {'result': res[0], 'type': MemberQueryResult.FOUND}
             else:
                 ret = {'result': None, 'type': MemberQueryResult.NOT_UNIQUE}
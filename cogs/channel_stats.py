@@ -1,32 +1,36 @@
 # Builtin
-import json
-import datetime
 import os
 import re
 
 # External
-import discord
 from discord.ext import commands, tasks
 
 # Internal
 import static.common as com
 import data.databaseapi as db
+import data.configapi as configapi
+import data.leaderboard as leaderboard
+import static.members as members
+import static.channels as channels
+import static.spawntimers as spawntimers
+from static.renames import RenameScheduler
 
-# Can only change channel name twice every 10 minutes
+# Names are recomputed this often, renames go through the scheduler which keeps each channel within two renames every 10 minutes
 REFRESH_TYPE = 'seconds'
-REFRESH_TIME = 360
-
-CAMP_HOURS_TILL_DS = 18
+REFRESH_TIME = 60
+RENAME_DRAIN_SECONDS = 15
 
 DEBUG = os.getenv('DEBUG')
 if DEBUG:
-    REFRESH_TIME = 360
+    REFRESH_TIME = 30
 
 class Channel_Stats(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        self.renames = RenameScheduler()
         self.printer.start()
+        self.rename_drain.start()
         self.last_data = {}
         print('Initilization on channel stats complete')
         
@@ -45,6 +49,8 @@ class Channel_Stats(commands.Cog):
         
     def cog_unload(self):
         self.printer.stop()
+        self.rename_drain.cancel()
+        self.renames.cancel()
         print('Channel Stats update stopped', flush=True)
     
     @tasks.loop(**{REFRESH_TYPE:REFRESH_TIME})
@@ -52,15 +58,13 @@ class Channel_Stats(commands.Cog):
         for guild in self.bot.guilds:
             if not self.guild_have_manage_channels(guild):
                 continue
-            config = get_config(guild.id)
+            config = configapi.get_guild_config(guild.id)
             if not config or not config.get('channel_stats'):
                 continue
             print(f"{com.get_current_iso()} [{guild.id}] - Refreshing channel stats")
             l = len(config['channel_stats'])
             
-            users = await db.get_unique_users(guild.id)
-            
-            res = await db.get_users_hours(guild.id, users, limit = l)
+            res = await leaderboard.get_top(guild.id, l)
             def ordinal(n: int):
                 if 11 <= (n % 100) <= 13:
                     suffix = 'th'
@@ -70,10 +74,7 @@ class Channel_Stats(commands.Cog):
             if res != self.last_data.get(guild.id):
                 self.last_data[guild.id] = res
                 for idx, chan in enumerate(config['channel_stats']):
-                    try:
-                        member = await guild.fetch_member(res[idx]['user'])
-                    except discord.errors.NotFound:
-                        member = None
+                    member = await members.get_member(guild, res[idx]['user'])
                     disp = 'placehold'
                     if member:
                         disp = member.display_name
@@ -81,47 +82,38 @@ class Channel_Stats(commands.Cog):
                         if nonletter:
                             disp = disp[:nonletter.start()]
                     name = f"{ordinal(idx+1)} {disp[:10]} - {res[idx]['total']}"
-                    channel = None
-                    for g_chan in guild.channels:
-                        if g_chan.id == chan:
-                            channel = g_chan
+                    channel = await channels.get_channel(guild, chan)
                     if not channel:
                         continue
-                    print(f'{com.get_current_iso()} [{guild.id}] - Setting channel {channel.name} to {name}')
-                    await channel.edit(name=name)
+                    self.renames.request(channel, name)
                 
-            now = com.get_current_datetime()
-            tod_dict = await db.get_tod(guild.id, mob_name="Drusella Sathir")
-            mins_till_ds = -1
+            now = com.get_current_timestamp()
+            timer = await spawntimers.get_timer(guild.id)
+            state = timer.state(now) if timer else 'unknown'
             mins_till_ds_str = "Unknown ToD"
-            if tod_dict:
-                tod_datetime = com.datetime_from_timestamp(tod_dict['tod_timestamp']) + datetime.timedelta(days=1)
-                mins_till_ds = int((tod_datetime - now).total_seconds()/com.SECS_IN_MINUTE)
-                if mins_till_ds < 0:
-                    mins_till_ds_str = "Unknown ToD"
-                else:
-                    mins_till_ds_str = f'DS in: {mins_till_ds:4}mins'
+            if state == 'window':
+                mins_till_ds_str = f'{timer.short} in window'
+            elif state != 'unknown':
+                mins_till_ds_str = f'{timer.short} in: {timer.mins_till_spawn(now):4}mins'
             channel = None
             if config.get('countdown_stats'):
-                channel = next((c for c in guild.channels if c.id == config['countdown_stats']), None)
-                if channel and channel.name != mins_till_ds_str and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
-                    print(f'{com.get_current_iso()} [{guild.id}] - Setting channel {channel.name} to {mins_till_ds_str}')
-                    await channel.edit(name=mins_till_ds_str)
+                channel = await channels.get_channel(guild, config['countdown_stats'])
+                if channel and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
+                    self.renames.request(channel, mins_till_ds_str)
             channel = None
             if config.get('campstatus_stats'):
                 _open = "<CLOSED"
-                if mins_till_ds >= 0 and mins_till_ds <= com.MINUTE_IN_HOUR * CAMP_HOURS_TILL_DS:
+                if state in ('open', 'window'):
                     _open = "<OPEN"
-                if mins_till_ds < 0:
+                if state == 'unknown':
                     _open = "<UNKNOWN"
                 ses = await db.get_session(guild.id)
                 if ses:
                     _open += "+ACTIVE"                
                 _open += ">"
-                channel = next((c for c in guild.channels if c.id == config['campstatus_stats']), None)
-                if channel and channel.name != _open and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
-                    print(f'{com.get_current_iso()} [{guild.id}] - Setting channel {channel.name} to {_open}')
-                    await channel.edit(name=_open)
+                channel = await channels.get_channel(guild, config['campstatus_stats'])
+                if channel and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
+                    self.renames.request(channel, _open)
             channel = None
             if config.get('active_stats') and config.get('max_active'):
                 _max = config.get('max_active')
@@ -132,14 +124,23 @@ class Channel_Stats(commands.Cog):
                 reps = await db.get_replacement_queue(guild.id)
                 if reps:
                     s += f'+{len(reps)}'
-                channel = next((c for c in guild.channels if c.id == config['active_stats']), None)
-                if channel and channel.name != s and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
-                    print(f'{com.get_current_iso()} [{guild.id}] - Setting channel {channel.name} to {s}')
-                    await channel.edit(name=s)
+                channel = await channels.get_channel(guild, config['active_stats'])
+                if channel and channel.permissions_for(guild.get_member(self.bot.user.id)).manage_channels:
+                    self.renames.request(channel, s)
             
 
-def get_config(guild_id):
-    return json.load(open('data/config.json', 'r', encoding='utf-8')).get(str(guild_id))
+    @tasks.loop(seconds=RENAME_DRAIN_SECONDS)
+    async def rename_drain(self):
+        self.renames.drain()
+
+    @rename_drain.before_loop
+    async def before_rename_drain(self):
+        await self.bot.wait_until_ready()
+
+    @printer.before_loop
+    async def before_printer(self):
+        await self.bot.wait_until_ready()
+        await configapi.load()
         
 
 def setup(bot):
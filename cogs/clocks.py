@@ -1,10 +1,6 @@
 # Builtin
 import datetime
-import json
-import asyncio
-import copy
 from enum import Enum
-from pathlib import Path
 
 # External
 import discord
@@ -14,9 +10,16 @@ from pycord.multicog import add_to_group
 
 # Internal
 import data.databaseapi as db
+import data.configapi as configapi
+import data.leaderboard as leaderboard
+import data.export as export
 import static.common as com
+import static.members as members
+import static.bonus as bonus
+import static.locks as locks
 from views.SkipQueueView import SkipQueueView
 from views.ClearOutView import ClearOutView
+from views.PageView import PageView
 from checks.IsAdmin import is_admin, NotAdmin
 from checks.IsCommandChannel import is_command_channel, NotCommandChannel
 from checks.IsMemberVisible import is_member_visible, NotMemberVisible
@@ -30,6 +33,8 @@ from checks.IsInDev import is_in_dev, InDevelopment
 #   Unless monospaced format is wanted (ie: ``` ```) for formating purposes, will display as EST timezone (need to assign tz info)
 # Any stored values NOT as integer timestamps are for info/debug ONLY do not access isoformats
 
+SESSIONS_PAGE_SIZE = 10
+
 class MemberQueryResult(Enum):
     FOUND = 1
     ID_NOT_FOUND = 2
@@ -41,7 +46,6 @@ class MemberQueryResult(Enum):
 class Clocks(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.state_lock = asyncio.Lock()
         
         print('Initilization on clocks complete', flush=True)
         
@@ -148,9 +152,9 @@ class Clocks(commands.Cog):
             return
         content = "_ _\nActive Users:\n```"
         for active in actives:
-            user = await ctx.guild.fetch_member(active['user'])
+            display_name = await members.get_display_name(ctx.guild, active['user'], default=str(active['user']), ctx=ctx)
             delta = com.get_hours_from_secs(timestamp_now - active['in_timestamp'])
-            content += f"\n{user.display_name[:19]:20}{delta:.2f} hours active"
+            content += f"\n{display_name[:19]:20}{delta:.2f} hours active"
         content += "```"
         await ctx.send_response(content=content, ephemeral=not public)
     
@@ -208,17 +212,30 @@ class Clocks(commands.Cog):
                     content += f'<@{rep["user"]}> '
                 content += '\n'
                 
-        rep_removed = await db.remove_replacement(ctx.guild.id, ctx.author.id)
-        
-        content += f'{ctx.author.display_name} {com.scram("Successfully")} clocked in at <t:{doc["in_timestamp"]}:f>'
-        if rep_removed is not None:
-            content += f' and was removed from replacement list'
-        
-        await db.store_active_record(ctx.guild.id, doc)
+        # The checks above ran before the view wait, repeat them under the locks
+        async with locks.user(ctx.guild.id, ctx.author.id), locks.guild(ctx.guild.id):
+            session = await db.get_session(ctx.guild.id)
+            row = None
+            if session:
+                doc['session'] = session['session']
+                row = await db.store_active_record(ctx.guild.id, doc)
+            if row:
+                rep_removed = await db.remove_replacement(ctx.guild.id, ctx.author.id)
+        if not session:
+            content = f'Sorry, the session ended before you were clocked in'
+        elif not row:
+            content = f'You are already active, did you mean to clockout?'
+        else:
+            content += f'{ctx.author.display_name} {com.scram("Successfully")} clocked in at <t:{doc["in_timestamp"]}:f>'
+            if rep_removed is not None:
+                content += f' and was removed from replacement list'
+            self.bot.dispatch('urnby_state_change', ctx.guild.id, 'clockin')
         try:
             await ctx.send_response(content=content)
         except (discord.errors.InteractionResponded, RuntimeError):
             await ctx.send_followup(content=content)
+        if not row:
+            return
         
         config = self.get_config(ctx.guild.id)
         if 'max_active' in config.keys() and config['max_active'] < len(actives)+1:
@@ -249,12 +266,14 @@ class Clocks(commands.Cog):
             return
         
         bonus_sessions = await self.get_bonus_sessions(ctx.guild.id, res['record'], res['row'])
-        member = await ctx.guild.fetch_member(target)
+        display_name = res['display_name']
         for item in bonus_sessions:
             row = await db.store_new_historical(ctx.guild.id, item)
-            tot = await db.get_user_hours(ctx.guild.id, member.id)
+            if row:
+                self.bot.dispatch('urnby_state_change', ctx.guild.id, 'bonus')
+            tot = com.get_hours_from_secs(await db.get_user_seconds(ctx.guild.id, target))
             
-            await ctx.send_followup(content=f'{member.display_name} Obtained bonus hours, stored record #{row} for {item["_DEBUG_delta"]} hours. Your total is at {round(tot, 2)}')
+            await ctx.send_followup(content=f'{display_name} Obtained bonus hours, stored record #{row} for {item["_DEBUG_delta"]} hours. Your total is at {round(tot, 2)}')
     
     @commands.user_command(name="Clockout User")
     @is_member()
@@ -266,44 +285,22 @@ class Clocks(commands.Cog):
         bonus_sessions = await self.get_bonus_sessions(ctx.guild.id, res['record'], res['row'])
         for item in bonus_sessions:
             row = await db.store_new_historical(ctx.guild.id, item)
-            tot = await db.get_user_hours(ctx.guild.id, member.id)
+            if row:
+                self.bot.dispatch('urnby_state_change', ctx.guild.id, 'bonus')
+            tot = com.get_hours_from_secs(await db.get_user_seconds(ctx.guild.id, member.id))
             await ctx.send_followup(content=f'{member.display_name} Obtained bonus hours, stored record #{row} for {item["_DEBUG_delta"]} hours. User total is at {round(tot, 2)}')
         return
     
     async def get_bonus_sessions(self, guild_id, record, row):
-        config = self.get_config(guild_id)
-        if not config.get('bonus_hours'):
-            return None
-        bonuses = []
-        
-        for bonus in config['bonus_hours']:
-            _in = com.datetime_from_timestamp(record['in_timestamp'])
-            _out = com.datetime_from_timestamp(record['out_timestamp'])
-            for day in range((_out.date() - _in.date()).days+1):
-                bonus_in = com.datetime_combine((_in.date()+datetime.timedelta(days=day)).isoformat(), bonus['start'])
-                bonus_out = com.datetime_combine((_in.date()+datetime.timedelta(days=day)).isoformat(), bonus['end'])
-                if _in <= bonus_out and _out >= bonus_in:
-                    
-                    print(f'{com.get_current_iso()} [{guild_id}] - Bonus hours found for {record["_DEBUG_user_name"]}', flush=True)
-                    #we have an intersection
-                    #duration calculation
-                    duration = int(min(_out.timestamp()-_in.timestamp(), 
-                                   _out.timestamp()-bonus_in.timestamp(), 
-                                   bonus_out.timestamp()-_in.timestamp(), 
-                                   bonus_out.timestamp()-bonus_in.timestamp()))
-                    duration = int(duration * (float(bonus['pct'])/100))
-                    start = _in if _in > bonus_in else bonus_in
-                    rec = copy.deepcopy(record)
-                    rec['character'] = f'{bonus["pct"]}_PCT_BONUS_{bonus["start"]}_TO_{bonus["end"]} {row}'
-                    rec['in_timestamp'] = int(start.timestamp())
-                    rec['out_timestamp'] = int(start.timestamp()+duration)
-                    rec['_DEBUG_in'] = start.isoformat()
-                    rec['_DEBUG_out'] = (start + datetime.timedelta(seconds=duration)).isoformat()
-                    rec['_DEBUG_delta'] = com.get_hours_from_secs(duration)
-                    bonuses.append(rec)
-        return bonuses
+        return bonus.evaluate(guild_id, record, row)
 
     async def _inner_clockout(self, ctx, user_id):
+        # May need a REST lookup, keep it out of the guild lock
+        display_name = await members.get_display_name(ctx.guild, user_id, default=str(user_id), ctx=ctx)
+        async with locks.user(ctx.guild.id, user_id), locks.guild(ctx.guild.id):
+            return await self._locked_clockout(ctx, user_id, display_name)
+
+    async def _locked_clockout(self, ctx, user_id, display_name):
         # Session Check
         session = await db.get_session(ctx.guild.id)
         if not session:
@@ -331,9 +328,9 @@ class Clocks(commands.Cog):
         
         if not res:
             return {'status': False, 'record': record, 'row': None, 'content': f'Failed to store record to historical, contact admin\n{found}'}
-        tot = await db.get_user_hours(ctx.guild.id, user_id)
-        user = await ctx.guild.fetch_member(user_id)
-        return {'status': True,'record': record, 'row': res, 'content': f'{user.display_name} {com.scram("Successfully")} clocked out at <t:{record["out_timestamp"]}>, stored record #{res} for {record["_DEBUG_delta"]} hours. Your total is at {round(tot, 2)}'}
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'clockout')
+        tot = com.get_hours_from_secs(await db.get_user_seconds(ctx.guild.id, user_id))
+        return {'status': True,'record': record, 'row': res, 'display_name': display_name, 'content': f'{display_name} {com.scram("Successfully")} clocked out at <t:{record["out_timestamp"]}>, stored record #{res} for {record["_DEBUG_delta"]} hours. Your total is at {round(tot, 2)}'}
     
     # ==============================================================================
     # Session Commands
@@ -356,9 +353,7 @@ class Clocks(commands.Cog):
     @is_member_visible()
     @is_command_channel()
     async def _sessionstart(self, ctx, sessionname: discord.Option(str, name="session_name", required=True)):
-        content = f"I'm busy updating, please try again later"
-        await self.state_lock.acquire()
-        try:
+        async with locks.guild(ctx.guild.id):
             session = await db.get_session(ctx.guild.id)
             if not session:
                 now = com.get_current_datetime()
@@ -376,12 +371,12 @@ class Clocks(commands.Cog):
                            }
                 row = await db.set_session(ctx.guild.id, session)
                 content = f'Session {session["session"]} started at <t:{session["start_timestamp"]}:f> - {row}'
+                if row:
+                    self.bot.dispatch('urnby_state_change', ctx.guild.id, 'session_start')
                 if not row:
                     content = f'Session start failed session names must be unique, try again or contact an administrator'
             else:
                 content = f'Sorry, a session, {session["session"]}, is already in place, please end the session before starting a new one'
-        finally:
-            self.state_lock.release()
         await ctx.send_response(content=content)
     
     @session_group.command(name='end', description='Ends active session, clocking out all active users in the process')
@@ -389,9 +384,7 @@ class Clocks(commands.Cog):
     @is_member_visible()
     @is_command_channel()
     async def _sessionend(self, ctx):
-        content = f"I'm busy updating, please try again later"
-        await self.state_lock.acquire()
-        try:
+        async with locks.guild(ctx.guild.id):
             session = await db.get_session(ctx.guild.id)
             if session:
                 now = com.get_current_datetime()
@@ -402,33 +395,20 @@ class Clocks(commands.Cog):
                 session['_DEBUG_delta'] = com.get_hours_from_secs(session['end_timestamp'] - 
                                                               session['start_timestamp'])
                 
-                actives = await db.get_all_actives(ctx.guild.id)
-                close_outs = []
-                fails = []
-                
-                for active in actives:
-                    res = await self._inner_clockout(ctx, active["user"])
-                    close_outs.append((res['record']['_DEBUG_user_name'], res['record']['_DEBUG_delta']))
-                    if not res['status']:
-                        fails.append(active)
-                        continue
-                    bonus_sessions = await self.get_bonus_sessions(ctx.guild.id, res['record'], res['row'])
-                    for item in bonus_sessions:
-                        row = await db.store_new_historical(ctx.guild.id, item)
-                        close_outs.append((item['_DEBUG_user_name'], f'Bonus id#{row}', item['_DEBUG_delta']))
-                content = f'Session, "{session["session"]}" ended and lasted {session["_DEBUG_delta"]} hours'
-                if close_outs:       
-                    content += f'\nAutomagically closed out {close_outs}'
-                if fails:
-                    content += f'\nFailed to close out record {fails}, contact administrator'
-                
-                await db.store_historical_session(ctx.guild.id, session)
-                await db.delete_session(ctx.guild.id)
-                await db.clear_replacement_queue(ctx.guild.id)
+                def bonus_fn(closed):
+                    return bonus.evaluate_many(ctx.guild.id, closed)
+                res = await db.close_session(ctx.guild.id, session, now, bonus_fn)
+                if res is None:
+                    content = f'Sorry there is no current session to end'
+                else:
+                    self.bot.dispatch('urnby_state_change', ctx.guild.id, 'session_end')
+                    close_outs = [(record['_DEBUG_user_name'], record['_DEBUG_delta']) for record, row in res['closed']]
+                    close_outs += [(item['_DEBUG_user_name'], f'Bonus id#{row}', item['_DEBUG_delta']) for item, row in res['bonuses']]
+                    content = f'Session, "{session["session"]}" ended and lasted {session["_DEBUG_delta"]} hours'
+                    if close_outs:       
+                        content += f'\nAutomagically closed out {close_outs}'
             else:
                 content=f'Sorry there is no current session to end'
-        finally:
-            self.state_lock.release()
         await ctx.send_response(content=content)
     
     # ==============================================================================
@@ -439,12 +419,7 @@ class Clocks(commands.Cog):
     @is_member()
     async def _list(self, ctx, public: discord.Option(bool, name='public', default=False)):
         # List all users in ranked order
-        # get unique users
-        users = await db.get_unique_users(ctx.guild.id)
-        
-        res = await db.get_users_hours(ctx.guild.id, users)
-        
-        sorted_res = sorted(res, key= lambda user: user['total'], reverse=True)
+        sorted_res = await leaderboard.get_top(ctx.guild.id)
         content_container = []
         content = '_ _\nUsers sorted by total time:'
         for idx, item in enumerate(sorted_res):
@@ -479,27 +454,34 @@ class Clocks(commands.Cog):
             # Time out
             return
         elif view.result == True:
-            tot = await db.get_user_seconds(ctx.guild.id, ctx.author.id)
-            session = await db.get_session(ctx.guild.id)
-            session_name = ''
-            if session:
-                session_name = session['session']
-            now = com.get_current_datetime()
-            hours = com.get_hours_from_secs(tot)
-            doc = {
-                'user': ctx.author.id,
-                'character': f"URN_ZERO_OUT_EVENT -{hours}",
-                'session': session_name,
-                'in_timestamp': int(now.timestamp()),
-                'out_timestamp': (now.timestamp())-tot,
-                '_DEBUG_user_name': ctx.author.display_name,
-                '_DEBUG_in': now.isoformat(),
-                '_DEBUG_out': now.isoformat(),
-                '_DEBUG_delta': -1*hours,
-            }
-            res = await db.store_new_historical(ctx.guild.id, doc)
+            # Time could have changed while the prompt was open, read it under the user lock
+            async with locks.user(ctx.guild.id, ctx.author.id):
+                if await db.is_user_active(ctx.guild.id, ctx.author.id):
+                    await view.message.edit(content=f'Please clock out before attempting to claim your Urn')
+                    return
+                tot = await db.get_user_seconds(ctx.guild.id, ctx.author.id)
+                session = await db.get_session(ctx.guild.id)
+                session_name = ''
+                if session:
+                    session_name = session['session']
+                now = com.get_current_datetime()
+                hours = com.get_hours_from_secs(tot)
+                doc = {
+                    'user': ctx.author.id,
+                    'character': f"URN_ZERO_OUT_EVENT -{hours}",
+                    'session': session_name,
+                    'in_timestamp': int(now.timestamp()),
+                    'out_timestamp': (now.timestamp())-tot,
+                    '_DEBUG_user_name': ctx.author.display_name,
+                    '_DEBUG_in': now.isoformat(),
+                    '_DEBUG_out': now.isoformat(),
+                    '_DEBUG_delta': -1*hours,
+                }
+                res = await db.store_new_historical(ctx.guild.id, doc)
             if not res:
                 print(f"Clearout failure\n {doc}", flush=True)
+            else:
+                self.bot.dispatch('urnby_state_change', ctx.guild.id, 'urn')
             await view.message.edit(content=f"Ooooh, yes! :urn: :tada: {hours} hours well spent!")
             return
         else:
@@ -520,24 +502,35 @@ class Clocks(commands.Cog):
             if userid is None:
                 return
                 
-        res = await db.get_user_commands_history(ctx.guild.id, userid, start_at=int(startat), count=int(count))
-        content = f"<@{userid}>'s last {len(res)} commands"
-        if startat:
-            content += f", starting at user's {startat}'th most recent command"
-        if res:
-            content += '```'
-        for item in res:
-            del item['server']
-            del item['user']
-            del item['user_name']
-            if item['options'] == 'None':
-                del item['options']
-            content += f"\n{str(item)}"
-        content = content[:1990]
-        if res:
-            content += '```'
-        await ctx.send_response(content=content, ephemeral=True)
-        pass
+        count = max(1, int(count))
+        res = await db.get_user_commands_history(ctx.guild.id, userid, start_at=int(startat), count=count)
+        
+        async def fetch_page(last_row):
+            return await db.get_user_commands_page(ctx.guild.id, userid, before_rowid=last_row['rowid'], count=count)
+        
+        def render(rows, page):
+            content = f"<@{userid}>'s last {len(rows)} commands"
+            if startat:
+                content += f", starting at user's {startat}'th most recent command"
+            if page > 1:
+                content += f", page {page}"
+            if rows:
+                content += '```'
+            for row in rows:
+                item = dict(row)
+                del item['server']
+                del item['user']
+                del item['user_name']
+                if item['options'] == 'None':
+                    del item['options']
+                content += f"\n{str(item)}"
+            content = content[:1990]
+            if rows:
+                content += '```'
+            return content
+        
+        view = PageView(ctx.author.id, res, fetch_page, render, count)
+        await ctx.send_response(content=view.content(), view=view, ephemeral=True)
     
     '''
     # Gets last 20 commands by user, returned as an ephemeral message or maybe all commands as an attached doc?
@@ -585,54 +578,43 @@ class Clocks(commands.Cog):
             if userid is None:
                 return
         
-        res = await db.get_historical_user(ctx.guild.id, userid)
+        res = await db.get_historical_user_page(ctx.guild.id, userid, count=SESSIONS_PAGE_SIZE)
         if len(res) == 0:
-            await ctx.send_response(content=f"{member.display_name} has no recorded sessions", ephemeral=True)
+            await ctx.send_response(content=f"<@{userid}> has no recorded sessions", ephemeral=True, allowed_mentions=discord.AllowedMentions(users=False))
             return
-        chunks = []
-        title = f"_ _\n<@{userid}> Sessions:\n"
-        content = ""
-        for item in res:
-            _in = com.datetime_from_timestamp(item['in_timestamp'])
-            _out = com.datetime_from_timestamp(item['out_timestamp'])
-            ses_hours = "Null"
-            if _timetype == 'Hours':
-                ses_hours = com.get_hours_from_secs(item['out_timestamp'] - item['in_timestamp'])
-            elif _timetype == 'Seconds':
-                ses_hours = item['out_timestamp'] - item['in_timestamp']
-            catagory = "  "
-            if "_PCT_BONUS_" in item['character']:
-                catagory = " +"
-            elif item['character'].startswith("URN_ZERO_OUT_EVENT"):
-                catagory = "⚱️"
-            elif item['character'] == "SOLO_HOLD_BONUS":
-                catagory = " S"
-            elif item['character'] == "QUAKE_DS_BONUS":
-                catagory = " Q"
-            tz = com.get_timezone_str()
-            content += f"\n{item['rowid']:5} {_in.date().isoformat()} - {item['session'][:50]:50}  {catagory} from {_in.time()} {_in.strftime('%Z')} to {_out.time()} {_out.strftime('%Z')} for {ses_hours} {_timetype.lower()}"
-            # Max message length is 2000, give 100 leway for title/user hours ending
-            if len(content) >= 1850:
-                clip_idx = content.rfind('\n', 0, 1850)
-                chunks.append(content[:clip_idx])
-                content = content[clip_idx:]
-        
         secs = await db.get_user_seconds(ctx.guild.id, userid)
         tot = com.get_hours_from_secs(secs)
-        tail = f"\n<@{userid}> has accrued {tot} hours. ({secs} seconds)"        
-        if res:
-            chunks.append(content)
+        tail = f"\n<@{userid}> has accrued {tot} hours. ({secs} seconds)"
         
-        for idx, chunk in enumerate(chunks):
-            if idx == 0:
-                content = title+"```"+chunk+"```"
-                if len(chunks) == 1:
-                    content += tail
-                await ctx.send_response(content=content, ephemeral=not _public, allowed_mentions=discord.AllowedMentions(users=False))
-            elif len(chunks) == idx+1:
-                await ctx.send_followup(content="```"+chunk+"```"+tail, ephemeral=not _public, allowed_mentions=discord.AllowedMentions(users=False))
-            else:
-                await ctx.send_followup(content="```"+chunk+"```", ephemeral=not _public, allowed_mentions=discord.AllowedMentions(users=False))
+        async def fetch_page(last_row):
+            return await db.get_historical_user_page(ctx.guild.id, userid, after_rowid=last_row['rowid'], count=SESSIONS_PAGE_SIZE)
+        
+        def render(rows, page):
+            title = f"_ _\n<@{userid}> Sessions, page {page}:\n"
+            content = ""
+            for item in rows:
+                _in = com.datetime_from_timestamp(item['in_timestamp'])
+                _out = com.datetime_from_timestamp(item['out_timestamp'])
+                ses_hours = "Null"
+                if _timetype == 'Hours':
+                    ses_hours = com.get_hours_from_secs(item['out_timestamp'] - item['in_timestamp'])
+                elif _timetype == 'Seconds':
+                    ses_hours = item['out_timestamp'] - item['in_timestamp']
+                catagory = "  "
+                if "_PCT_BONUS_" in item['character']:
+                    catagory = " +"
+                elif item['character'].startswith("URN_ZERO_OUT_EVENT"):
+                    catagory = "⚱️"
+                elif item['character'] == "SOLO_HOLD_BONUS":
+                    catagory = " S"
+                elif item['character'] == "QUAKE_DS_BONUS":
+                    catagory = " Q"
+                content += f"\n{item['rowid']:5} {_in.date().isoformat()} - {item['session'][:50]:50}  {catagory} from {_in.time()} {_in.strftime('%Z')} to {_out.time()} {_out.strftime('%Z')} for {ses_hours} {_timetype.lower()}"
+            # Max message length is 2000, give 100 leway for title/user hours ending
+            return title+"```"+content[:1850]+"```"+tail
+        
+        view = PageView(ctx.author.id, res, fetch_page, render, SESSIONS_PAGE_SIZE)
+        await ctx.send_response(content=view.content(), view=view, ephemeral=not _public, allowed_mentions=discord.AllowedMentions(users=False))
     
     #TODO condense this with slash command of same name
     @commands.user_command(name="Get User Sessions")
@@ -676,31 +658,33 @@ class Clocks(commands.Cog):
         userid = await check_user_id(ctx, _id)
         if userid is None:
             return
-        secs = await db.get_user_seconds(ctx.guild.id, userid)
-        hours = com.get_hours_from_secs(secs)
-        datetime_kill = com.datetime_from_iso(date+"T"+time+":00-05:00")
-        rev_timestamp = datetime_kill.timestamp() - secs
-        rev_datetime = com.datetime_from_timestamp(rev_timestamp)
-        doc = {
-                'user': int(userid),
-                'character': f"URN_ZERO_OUT_EVENT -{hours}",
-                'session': sessionname,
-                'in_timestamp': int(datetime_kill.timestamp()),
-                'out_timestamp': int(rev_timestamp),
-                '_DEBUG_user_name': username,
-                '_DEBUG_in': datetime_kill.isoformat(),
-                '_DEBUG_out': rev_datetime.isoformat(),
-                '_DEBUG_delta': -1*hours,
-            }
-        try:
-            res = await db.store_new_historical(ctx.guild.id, doc)
-        except OperationalError as err:
-            await ctx.send_response(content=f'Failed, database error - {err}, please try again or contact an administator')
-            return
+        async with locks.user(ctx.guild.id, userid):
+            secs = await db.get_user_seconds(ctx.guild.id, userid)
+            hours = com.get_hours_from_secs(secs)
+            datetime_kill = com.datetime_from_iso(date+"T"+time+":00-05:00")
+            rev_timestamp = datetime_kill.timestamp() - secs
+            rev_datetime = com.datetime_from_timestamp(rev_timestamp)
+            doc = {
+                    'user': int(userid),
+                    'character': f"URN_ZERO_OUT_EVENT -{hours}",
+                    'session': sessionname,
+                    'in_timestamp': int(datetime_kill.timestamp()),
+                    'out_timestamp': int(rev_timestamp),
+                    '_DEBUG_user_name': username,
+                    '_DEBUG_in': datetime_kill.isoformat(),
+                    '_DEBUG_out': rev_datetime.isoformat(),
+                    '_DEBUG_delta': -1*hours,
+                }
+            try:
+                res = await db.store_new_historical(ctx.guild.id, doc)
+            except OperationalError as err:
+                await ctx.send_response(content=f'Failed, database error - {err}, please try again or contact an administator')
+                return
         if not res:
             await ctx.send_response(content=f'Something went wrong, return index 0 please contact an administator')
             return
-        tot = await db.get_user_hours(ctx.guild.id, int(userid))
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'urn')
+        tot = com.get_hours_from_secs(await db.get_user_seconds(ctx.guild.id, int(userid)))
         
         await ctx.send_response(content=f'{username} - <@{int(userid)}> {com.scram("Successfully")} URNed and stored record #{res} for {doc["_DEBUG_delta"]} hours. Total is at {tot}')
     
@@ -743,6 +727,7 @@ class Clocks(commands.Cog):
         rec['_DEBUG_delta'] = com.get_hours_from_secs(rec['out_timestamp']-rec['in_timestamp'])    
         res = await db.delete_historical_record(ctx.guild.id, row)
         res = await db.store_new_historical(ctx.guild.id, rec)
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'change_history')
         await ctx.send_response(content=f'Updated record #{row}, {_type} from {was["_DEBUG"]} to {_datetime.isoformat()} for user <@{rec["user"]}>', allowed_mentions=discord.AllowedMentions(users=False))
     
     @admin_group.command(name='directrecord', description='Add a historical record for a user')
@@ -794,39 +779,103 @@ class Clocks(commands.Cog):
         if not res:
             await ctx.send_response(content=f'Something went wrong, return index 0 please contact an administator')
             return
-        tot = await db.get_user_hours(ctx.guild.id, int(userid))
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'direct_record')
+        tot = com.get_hours_from_secs(await db.get_user_seconds(ctx.guild.id, int(userid)))
         await ctx.send_response(content=f'{username} - <@{int(userid)}> {com.scram("Successfully")} clocked out and stored record #{res} for {doc["_DEBUG_delta"]} hours. Total is at {tot}')
-    
+
+    @admin_group.command(name='totals', description='Verify or rebuild the stored user totals against historical records')
+    @is_admin()
+    async def _admintotals(self, ctx, action: discord.Option(str, name="action", choices=['Verify', 'Rebuild'], default='Verify')):
+        if action == 'Rebuild':
+            count = await db.rebuild_user_totals(ctx.guild.id)
+            await ctx.send_response(content=f'Rebuilt stored totals for {count} users')
+            return
+        mismatches = await db.verify_user_totals(ctx.guild.id)
+        if not mismatches:
+            await ctx.send_response(content=f'Stored user totals match historical records', ephemeral=True)
+            return
+        content = f'{len(mismatches)} users have stored totals that do not match historical records, use action Rebuild to fix:'
+        for item in mismatches:
+            content += f"\n<@{item['user']}> stored {item['stored']} seconds / {item['stored_count']} records, expected {item['expected']} seconds / {item['expected_count']} records"
+        await ctx.send_response(content=content[:1990], ephemeral=True, allowed_mentions=discord.AllowedMentions(users=False))
+
+    @admin_group.command(name='locks', description='Show how often state changing commands waited on each other')
+    @is_admin()
+    async def _adminlocks(self, ctx):
+        content = f'{locks.held()} locks held or waited on right now'
+        for kind, item in locks.stats.items():
+            avg = item['wait_total']/item['contended'] if item['contended'] else 0
+            content += f"\n{kind}: {item['acquired']} acquired, {item['contended']} waited, avg wait {avg:.3f}s, max wait {item['wait_max']:.3f}s"
+        await ctx.send_response(content=content, ephemeral=True)
+
+    @admin_group.command(name='bonuses', description='Compare or recompute stored bonus hour records against the current bonus config')
+    @is_admin()
+    async def _adminbonuses(self, ctx, action: discord.Option(str, name="action", choices=['Verify', 'Rebuild'], default='Verify')):
+        await ctx.defer(ephemeral=action == 'Verify')
+        historical = await db.get_historical(ctx.guild.id)
+        missing, stale = bonus.plan_recompute(ctx.guild.id, historical)
+        if not missing and not stale:
+            await ctx.send_followup(content=f'Stored bonus records match the current bonus hours config')
+            return
+        if action == 'Rebuild':
+            rows = await db.replace_bonus_records(ctx.guild.id, [record['rowid'] for record in stale], missing)
+            self.bot.dispatch('urnby_state_change', ctx.guild.id, 'bonus_rebuild')
+            await ctx.send_followup(content=f'Removed {len(stale)} bonus records and stored {len(rows)} recomputed from the current bonus hours config')
+            return
+        content = f'{len(stale)} stored bonus records no longer apply and {len(missing)} are missing, use action Rebuild to fix:'
+        for record in stale:
+            content += f"\n- #{record['rowid']} <@{record['user']}> {record['character']} for {record['_DEBUG_delta']} hours"
+        for record in missing:
+            content += f"\n+ <@{record['user']}> {record['character']} for {record['_DEBUG_delta']} hours"
+        await ctx.send_followup(content=content[:1990], allowed_mentions=discord.AllowedMentions(users=False))
+
     # ==============================================================================
     # Data functions
     # ==============================================================================
     
     @get_group.command(name='data', description='Command to retrive all data of a table')
     @is_member()
-    async def _getdata(self, ctx, data_type=discord.Option(name='datatype', choices=['actives','historical','session', 'historicalsession', 'commands', 'errors'], default='historical')):
-        res = await db.flush_wal()
-        if not res:
-            await ctx.send_response(content='Couldn\'t flush journal, possible multiple connections active, contact administrator')
-            return
-        if data_type == 'historical':
-            data = await db.get_historical(ctx.guild.id)
-        elif data_type == 'actives':
-            data = await db.get_all_actives(ctx.guild.id)
-        elif data_type == 'session':
-            data = [await db.get_session(ctx.guild.id)]
-        elif data_type == 'commands':
-            data = await db.get_commands_history(ctx.guild.id)
-        else:
+    async def _getdata(self, ctx, 
+                       data_type: discord.Option(str, name='datatype', choices=['actives','historical','session', 'historicalsession', 'commands', 'errors'], default='historical'),
+                       fmt: discord.Option(str, name='format', choices=export.FORMATS, default='ndjson'),
+                       compress: discord.Option(bool, name='compress', default=False),
+                       _id: discord.Option(str, name='user_id', default=None),
+                       startdate: discord.Option(str, name='startdate', description="Form YYYY-MM-DD", default=None),
+                       enddate: discord.Option(str, name='enddate', description="Form YYYY-MM-DD, inclusive", default=None),
+                       live: discord.Option(bool, name='live', description="Read the live database instead of the latest backup snapshot", default=False)):
+        if data_type not in export.EXPORT_TABLES:
             await ctx.send_response(content='Option not available yet')
             return
-        out_file = Path('/temp/data.json')
-        out_file.parent.mkdir(exist_ok=True, parents=True)
-        json.dump(data, open('temp/data.json', 'w', encoding='utf-8'), indent=1)
-        await ctx.send_response(content='Here\'s the data!', file=discord.File('temp/data.json', filename='data.json'))
+        userid = None
+        if _id is not None:
+            userid = await check_user_id(ctx, _id)
+            if userid is None:
+                return
+        try:
+            start_datetime = com.datetime_combine(startdate, '00:00') if startdate else None
+            end_datetime = com.datetime_combine((datetime.date.fromisoformat(enddate)+datetime.timedelta(days=1)).isoformat(), '00:00') if enddate else None
+        except ValueError as err:
+            await ctx.send_response(content=f'Invalid date, use the form YYYY-MM-DD - {err}', ephemeral=True)
+            return
+        
+        await ctx.defer()
+        fp, filename, count, snapshot_ts = await export.export_table(ctx.guild.id, data_type, fmt=fmt, compress=compress, 
+                                                                    start_datetime=start_datetime, end_datetime=end_datetime, user_id=userid, live=live)
+        source = f'snapshot from <t:{snapshot_ts}:f>' if snapshot_ts else 'live database'
+        if count == 0:
+            fp.close()
+            await ctx.send_followup(content=f'No {data_type} rows matched in the {source}')
+            return
+        try:
+            await ctx.send_followup(content=f'Here\'s the data! {count} rows from the {source}', file=discord.File(fp, filename=filename))
+        except discord.errors.HTTPException as err:
+            await ctx.send_followup(content=f'Could not upload the export, try compress or narrowing with user/date filters - {err}')
+        finally:
+            fp.close()
         return
     
     def get_config(self, guild_id):
-        return json.load(open('data/config.json', 'r', encoding='utf-8')).get(str(guild_id))
+        return configapi.get_guild_config(guild_id)
     
 
 # function to accept a user id to check, or partial/full string to match user name on, returns None on didnt find or an userid int
@@ -834,14 +883,11 @@ async def check_user_id(ctx, param) -> int:
     # Try userid for int interpretation
     ret = {'result': None, 'type': MemberQueryResult.QUERY_FAILED}
     try:
-        int(param)
-        res = await ctx.guild.fetch_member(int(param))
-        ret = {'result': res, 'type': MemberQueryResult.FOUND}
+        res = await members.get_member(ctx.guild, int(param), ctx)
+        ret = {'result': res, 'type': MemberQueryResult.FOUND if res else MemberQueryResult.ID_NOT_FOUND}
     except (ValueError, TypeError) as err:
         # Failed int parsing
         pass 
-    except discord.errors.NotFound:
-        ret = {'result': None, 'type': MemberQueryResult.ID_NOT_FOUND}
     
     if not ret['result']:
         # try querying string for member
@@ -850,6 +896,7 @@ async def check_user_id(ctx, param) -> int:
             if len(res) == 0:
                 ret = {'result': None, 'type': MemberQueryResult.ID_NOT_FOUND}
             elif len(res) == 1:
+                members.remember(res[0])
                 ret = {'result': res[0], 'type': MemberQueryResult.FOUND}
             else:
                 ret = {'result': None, 'type': MemberQueryResult.NOT_UNIQUE}
@@ -1,9 +1,8 @@
 # Builtin
-import datetime
-import json
 import asyncio
 import time
 import os
+import hashlib
 from enum import Enum
 
 # External
@@ -12,7 +11,12 @@ from discord.ext import commands, tasks
 
 # Internal
 import data.databaseapi as db
+import data.configapi as configapi
+import data.leaderboard as leaderboard
 import static.common as com
+import static.members as members
+import static.channels as channels
+import static.spawntimers as spawntimers
 from checks.IsAdmin import is_admin, NotAdmin
 from checks.IsCommandChannel import is_command_channel, NotCommandChannel
 from checks.IsMemberVisible import is_member_visible, NotMemberVisible
@@ -20,12 +24,16 @@ from checks.IsMember import is_member, NotMember
 from checks.IsInDev import is_in_dev, InDevelopment
 
 REFRESH_TYPE = 'seconds'
-REFRESH_TIME = 60
-CAMP_HOURS_TILL_DS = 18
+REFRESH_TIME = 120
+DEBOUNCE_SECONDS = 2
+MAX_CONCURRENT_REFRESHES = 4
+REFRESH_TIMEOUT = 45
+# Seconds an unchanged dashboard may go without an edit, keeps the last updated stamp from looking stuck
+DASH_MAX_STALENESS = int(os.getenv('DASH_MAX_STALENESS', 600))
 
 DEBUG = os.getenv('DEBUG')
 if DEBUG:
-    REFRESH_TIME = 15
+    REFRESH_TIME = 30
 
 class Format(Enum):
     Normal = 0
@@ -77,12 +85,14 @@ class Dashboard(commands.Cog):
         self.bot = bot
         self.delay = {}
         self.open_transitioned = {}
-        self.cache_datetime = None
-        self.config_cache = {}
-        self.refresh_cache_config()
         self.printer.start()
         self.dash_message = {}
         self.dash_mobile_message = {}
+        self.pending_refresh = {}
+        self.refresh_locks = {}
+        self.refresh_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REFRESHES)
+        self.last_edit = {}
+        self.edit_stats = {}
         print('Initilization on dashboard complete')
         
     # ==============================================================================
@@ -131,6 +141,7 @@ class Dashboard(commands.Cog):
  
     @commands.Cog.listener()
     async def on_ready(self):
+        await configapi.load()
         missing_tables = await db.check_tables(['historical', 'session', 'session_history', 'active', 'tod'])
         if missing_tables:
             print(f"Warning, Dashboard reports missing the following tables in db: {missing_tables}")
@@ -139,7 +150,7 @@ class Dashboard(commands.Cog):
             config = self.get_config(guild.id)
             if not config:
                 continue
-            await self._purge_dashboard(guild)
+            await self._attach_dashboard(guild)
 
     def cog_unload(self):
         self.printer.stop()
@@ -170,243 +181,307 @@ class Dashboard(commands.Cog):
         else:
             self.delay[ctx.guild.id] = False
             await ctx.send_response(f"Refeshing should be enabled. Forcing update, if no update comes, contact admin")
+        for message in [self.dash_message.get(ctx.guild.id), self.dash_mobile_message.get(ctx.guild.id)]:
+            if message:
+                self.last_edit.pop(message.id, None)
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'dashboardrefresh')
     
-    async def _purge_dashboard(self, guild):
+    @commands.slash_command(name="dashboardstats", description='Ephemeral - Dashboard edits sent and skipped since startup')
+    @is_member()
+    async def _dashboardstats(self, ctx):
+        stats = self.edit_stats.get(ctx.guild.id, {'sent': 0, 'skipped': 0})
+        total = stats['sent'] + stats['skipped']
+        pct = round(100 * stats['skipped'] / total) if total else 0
+        await ctx.send_response(content=f"Dashboard edits sent {stats['sent']}, skipped {stats['skipped']} ({pct}% unchanged)", ephemeral=True)
+    
+    # kind -> (config key of the channel, attribute holding the message per guild)
+    def _dash_kinds(self):
+        return {'desktop': ('dashboard_channel', self.dash_message), 'mobile': ('mobile_dash_channel', self.dash_mobile_message)}
+
+    # Purges our messages from the channel and posts a fresh dashboard message, remembering its id
+    async def _repost_dashboard(self, guild, kind):
         def chk(msg):
             if msg.author.id == self.bot.user.id:
                 return True
             return False
+        config_key, messages = self._dash_kinds()[kind]
         config = self.get_config(guild.id)
-        if config.get('dashboard_channel'):
-            print(f'{com.get_current_iso()} [{guild.id}] - Purging dashboard', flush=True)
-            channel = await guild.fetch_channel(config['dashboard_channel'])
-            await channel.purge(check=chk)
-            self.dash_message[guild.id] = await channel.send(content=f'Starting Dashboard...', silent=True)
+        print(f'{com.get_current_iso()} [{guild.id}] - Purging {kind} dashboard', flush=True)
+        channel = await channels.get_channel(guild, config[config_key])
+        if channel is None:
+            print(f'{com.get_current_iso()} [{guild.id}] - {kind} dashboard channel {config[config_key]} not found', flush=True)
+            return
+        await channel.purge(check=chk)
+        messages[guild.id] = await channel.send(content=f'Starting Dashboard...', silent=True)
+        await db.set_dashboard_message(guild.id, kind, channel.id, messages[guild.id].id)
 
-        if config.get('mobile_dash_channel'):
-            print(f'{com.get_current_iso()} [{guild.id}] - Purging mobile dash', flush=True)
-            mobile_channel = await guild.fetch_channel(config['mobile_dash_channel'])
-            await mobile_channel.purge(check=chk)
-            self.dash_mobile_message[guild.id] = await mobile_channel.send(content=f'Starting Dashboard...', silent=True)
+    async def _purge_dashboard(self, guild):
+        config = self.get_config(guild.id)
+        for kind, (config_key, messages) in self._dash_kinds().items():
+            if config.get(config_key):
+                await self._repost_dashboard(guild, kind)
 
-    
+    # Reattaches to the dashboard messages posted before a restart, reposting only the ones that are gone or moved
+    async def _attach_dashboard(self, guild):
+        config = self.get_config(guild.id)
+        stored = await db.get_dashboard_messages(guild.id)
+        for kind, (config_key, messages) in self._dash_kinds().items():
+            if not config.get(config_key) or messages.get(guild.id):
+                continue
+            known = stored.get(kind)
+            if known and known['channel_id'] == config[config_key]:
+                channel = await channels.get_channel(guild, known['channel_id'])
+                try:
+                    if channel:
+                        messages[guild.id] = await channel.fetch_message(known['message_id'])
+                        print(f'{com.get_current_iso()} [{guild.id}] - Reattached {kind} dashboard {known["message_id"]}', flush=True)
+                        continue
+                except (discord.errors.NotFound, discord.errors.Forbidden):
+                    pass
+            await self._repost_dashboard(guild, kind)
+
+    # Slow heartbeat that keeps the countdown current, state changes refresh the affected guild through on_urnby_state_change
     @tasks.loop(**{REFRESH_TYPE:REFRESH_TIME})
     async def printer(self):
-        for guild in self.bot.guilds:
-            
-            config = self.get_config(guild.id)
-            if not config or not config.get('dashboard_channel'):
-                continue
-            channel = await guild.fetch_channel(config['dashboard_channel'])
-            mobile_channel = None
-            if config.get('mobile_dash_channel'):
-                mobile_channel = await guild.fetch_channel(config['mobile_dash_channel'])
-            if not self.dash_message.get(guild.id):
-                await channel.send(content=f'Starting Dashboard...', silent=True)
-            if not self.dash_mobile_message.get(guild.id):
-                await mobile_channel.send(content=f'Starting Dashboard...', silent=True)
-            session_real = await db.get_session(guild.id)
-            historical_recs_from_session = []
-            if session_real:
-                historical_recs_from_session = await db.get_historical_session(guild.id, session_real['session'])
-            now = com.get_current_datetime()
-            tod_dict = await db.get_tod(guild.id, mob_name="Drusella Sathir")
-            mins_till_ds_str = "Unknown"
-            if tod_dict:
-                tod_datetime = com.datetime_from_timestamp(tod_dict['tod_timestamp']) + datetime.timedelta(days=1)
-                mins_till_ds = int((tod_datetime - now).total_seconds()/com.SECS_IN_MINUTE)
-                if mins_till_ds < 0:
-                    mins_till_ds_str = "Unknown"
-                else:
-                    mins_till_ds_str = f'{mins_till_ds:4}mins'
-            _open = ""
-            if mins_till_ds >= 0 and mins_till_ds <= com.MINUTE_IN_HOUR * CAMP_HOURS_TILL_DS:
-                _open = "<OPEN>"
-                # If we are in delayed mode, and we havent refreshed with the new transition, refresh automatically
-                if self.delay.get(guild.id) and not self.open_transitioned.get(guild.id):
-                    self.open_transitioned[guild.id] = True
-                    self.delay[guild.id] = False
-                    await self._purge_dashboard(guild)
-            if self.delay.get(guild.id) and session_real:
+        # Guilds refresh side by side so a slow guild only delays its own board
+        await asyncio.gather(*[self._safe_refresh(guild, 'heartbeat') for guild in self.bot.guilds])
+
+    # Coalesces bursts of state changes into one refresh per guild after DEBOUNCE_SECONDS
+    @commands.Cog.listener()
+    async def on_urnby_state_change(self, guild_id, reason):
+        pending = self.pending_refresh.get(guild_id)
+        if pending and not pending.done():
+            return
+        self.pending_refresh[guild_id] = asyncio.create_task(self._debounced_refresh(guild_id, reason))
+
+    async def _debounced_refresh(self, guild_id, reason):
+        await asyncio.sleep(DEBOUNCE_SECONDS)
+        # Changes arriving from here on schedule their own refresh, this one may already have read older state
+        self.pending_refresh.pop(guild_id, None)
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        print(f'{com.get_current_iso()} [{guild_id}] - Dashboard refresh on {reason}', flush=True)
+        await self._safe_refresh(guild, reason)
+
+    # Bounded by MAX_CONCURRENT_REFRESHES and REFRESH_TIMEOUT, errors are logged so one guild can not stop the loop
+    async def _safe_refresh(self, guild, reason):
+        try:
+            async with self.refresh_semaphore:
+                await asyncio.wait_for(self.refresh_guild(guild), timeout=REFRESH_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f'{com.get_current_iso()} [{guild.id}] - Dashboard refresh on {reason} timed out after {REFRESH_TIMEOUT}s', flush=True)
+        except Exception as err:
+            print(f'{com.get_current_iso()} [{guild.id}] - Dashboard refresh on {reason} failed: {err}', flush=True)
+
+    async def refresh_guild(self, guild):
+        async with self.refresh_locks.setdefault(guild.id, asyncio.Lock()):
+            await self._refresh_guild(guild)
+
+    async def _refresh_guild(self, guild):
+        config = self.get_config(guild.id)
+        if not config or not config.get('dashboard_channel'):
+            return
+        mobile_channel = None
+        if config.get('mobile_dash_channel'):
+            mobile_channel = await channels.get_channel(guild, config['mobile_dash_channel'])
+        if not self.dash_message.get(guild.id) or (mobile_channel and not self.dash_mobile_message.get(guild.id)):
+            await self._attach_dashboard(guild)
+        ex_lines = 7
+        snapshot = await db.get_dashboard_snapshot(guild.id)
+        session_real = snapshot.session
+        now = com.get_current_datetime()
+        timer = await spawntimers.get_timer(guild.id)
+        state = timer.state(now.timestamp()) if timer else 'unknown'
+        mins_till_ds_str = "Unknown"
+        if state == 'window':
+            mins_till_ds_str = "Window"
+        elif state != 'unknown':
+            mins_till_ds_str = f'{timer.mins_till_spawn(now.timestamp()):4}mins'
+        _open = ""
+        if state in ('open', 'window'):
+            _open = "<OPEN>"
+            # If we are in delayed mode, and we havent refreshed with the new transition, refresh automatically
+            if self.delay.get(guild.id) and not self.open_transitioned.get(guild.id):
+                self.open_transitioned[guild.id] = True
                 self.delay[guild.id] = False
                 await self._purge_dashboard(guild)
-                    
-            elif self.delay.get(guild.id) and not session_real:
-                continue
-            
-            
-            actives = await db.get_all_actives(guild.id)
-            
+        if self.delay.get(guild.id) and session_real:
+            self.delay[guild.id] = False
+            await self._purge_dashboard(guild)
+                
+        elif self.delay.get(guild.id) and not session_real:
+            return
+        
+        
+        actives = snapshot.actives
+        
+        for item in actives:
+            item['delta'] = com.get_hours_from_secs(now.timestamp() - item['in_timestamp'])
+            item['display_name'] = await members.get_display_name(guild, item['user'])
+            item['ses_delta'] = round(item['delta'] + snapshot.session_hours.get(item['user'], 0), 2)
+        
+        if not session_real:
+            session = {'session': "None"}
+            timestr = ''
+        else:
+            session = session_real
+            timestr = com.datetime_from_timestamp(session['start_timestamp']).strftime("%b%d %I:%M%p")
+        
+        camp_queue = snapshot.reps
+        
+        # NOTE! Actives and Camp queue must be completed before this step as we are limiting based on the number of the aforementioned 
+        lines = 2
+        cont_lines = len(actives) + len(camp_queue)
+        res = await leaderboard.get_top(guild.id, ex_lines+cont_lines)
+        
+        for item in res:
+            item['display_name'] = await members.get_display_name(guild, item['user'])
+        
+        def get_seperator(mobile=False):
+            reduce = 0
+            if mobile:
+                reduce = 10
+            return f"{'-'*(50-reduce)}"
+        
+        def get_col1(mobile=False):
+            col1 = []
+            reduce = 0
+            if mobile:
+                reduce = 10
+            seperator = get_seperator(mobile)
+            # 1st column 50 spaces 
+            col1.append(f"{' Active Session':15}{_open:^{19-reduce}}{'DS in: ':7}{mins_till_ds_str:8}{' ':1}")
+            col1.append(seperator)
+            col1.append(f"{' ' + session['session'][:28-reduce]:{30-reduce}}{'@ ':2}{timestr:13}{' EST ':5}")
+            col1.append(seperator)
+            col1.append(f"{' Active Users':<{34-reduce}}{'Current / Total':>15}{' ':1}") 
+            col1.append(seperator)
             for item in actives:
-                item['display_name'] = 'placeholder'
-                item['delta'] = com.get_hours_from_secs(now.timestamp() - item['in_timestamp'])
-                mem_historical = [_ for _ in historical_recs_from_session if _['user'] == item['user']]
-                item['ses_delta'] = item['delta']
-                try:
-                    member = await guild.fetch_member(int(item['user']))
-                except discord.errors.NotFound:
-                    member = None
-                if member:
-                    item['display_name'] = member.display_name
-                for _item in mem_historical:
-                    if "PCT_BONUS" in _item['character']:
-                        continue
-                    item['ses_delta'] += com.get_hours_from_secs(_item['out_timestamp'] - _item['in_timestamp'])
-                item['ses_delta'] = round(item['ses_delta'], 2)
-            
-            if not session_real:
-                session = {'session': "None"}
-                timestr = ''
-            else:
-                session = session_real
-                timestr = com.datetime_from_timestamp(session['start_timestamp']).strftime("%b%d %I:%M%p")
-            
-            camp_queue = await db.get_replacement_queue(guild.id)
-            
-            # NOTE! Actives and Camp queue must be completed before this step as we are limiting based on the number of the aforementioned 
-            lines = 2
-            ex_lines = 7
-            cont_lines = len(actives) + len(camp_queue)
-            users = await db.get_unique_users(guild.id)
-            
-            res = await db.get_users_hours(guild.id, users, limit = ex_lines+cont_lines)
-            
-            for item in res:
-                item['display_name'] = 'placeholder'
-                if guild.get_member(int(item['user'])):
-                    item['display_name'] = next((x.display_name for x in guild.members if x.id == int(item['user'])), None)
+                if item['ses_delta'] >= 6:
+                    color = TextColor.Red
                 else:
-                    try:
-                        member = await guild.fetch_member(int(item['user']))
-                    except discord.errors.NotFound:
-                        continue
-                    item['display_name'] = member.display_name
-            
-            def get_seperator(mobile=False):
-                reduce = 0
-                if mobile:
-                    reduce = 10
-                return f"{'-'*(50-reduce)}"
-            
-            def get_col1(mobile=False):
-                col1 = []
-                reduce = 0
-                if mobile:
-                    reduce = 10
-                seperator = get_seperator(mobile)
-                # 1st column 50 spaces 
-                col1.append(f"{' Active Session':15}{_open:^{19-reduce}}{'DS in: ':7}{mins_till_ds_str:8}{' ':1}")
-                col1.append(seperator)
-                col1.append(f"{' ' + session['session'][:28-reduce]:{30-reduce}}{'@ ':2}{timestr:13}{' EST ':5}")
-                col1.append(seperator)
-                col1.append(f"{' Active Users':<{34-reduce}}{'Current / Total':>15}{' ':1}") 
-                col1.append(seperator)
-                for item in actives:
-                    if item['ses_delta'] >= 6:
-                        color = TextColor.Red
-                    else:
-                        color = TextColor.Green
-                    formated_times = ansi_format(f"{item['delta']:>5.2f}{' / ':3}{item['ses_delta']:>5.2f}{' ':1}", format=Format.Bold, color=color)
-                    col1.append(f"{' ' + item['display_name'][:24-reduce]:{36-reduce}}{formated_times:14}")
-                col1.append(seperator)
-                col1.append(f"{' Camp Queue':{36-reduce}}{'Mins in queue':>13}{' ':1}")
-                col1.append(seperator)
-                now = com.get_current_datetime()
-                for item in camp_queue:
-                    mins = int((now - com.datetime_from_timestamp(item['in_timestamp'])).total_seconds()/com.SECS_IN_MINUTE)
-                    col1.append(f"{' ' + item['name'][:41-reduce]:{43-reduce}}{' @ ':3}{mins:3}{' ':1}")
-                return col1
+                    color = TextColor.Green
+                formated_times = ansi_format(f"{item['delta']:>5.2f}{' / ':3}{item['ses_delta']:>5.2f}{' ':1}", format=Format.Bold, color=color)
+                col1.append(f"{' ' + item['display_name'][:24-reduce]:{36-reduce}}{formated_times:14}")
+            col1.append(seperator)
+            col1.append(f"{' Camp Queue':{36-reduce}}{'Mins in queue':>13}{' ':1}")
+            col1.append(seperator)
+            now = com.get_current_datetime()
+            for item in camp_queue:
+                mins = int((now - com.datetime_from_timestamp(item['in_timestamp'])).total_seconds()/com.SECS_IN_MINUTE)
+                col1.append(f"{' ' + item['name'][:41-reduce]:{43-reduce}}{' @ ':3}{mins:3}{' ':1}")
+            return col1
+        
+        def get_col2(mobile=False):
+            #Appending 2nd column
+            col2 = []
+            reduce = 0
+            if mobile:
+                reduce = 10
+            seperator = get_seperator(mobile)
+            col2.append(f" Top {ex_lines+cont_lines} in Hours")
+            col2.append(seperator)
+            for idx in range(ex_lines+cont_lines):
+                if idx >= len(res):
+                    col2.append(f"")
+                    continue
+                match idx:
+                    case 0:
+                        medal='🥇'
+                    case 1:
+                        medal='🥈'
+                    case 2:
+                        medal='🥉'
+                    case _:
+                        medal=''
+                col2.append(f"{' ' + res[idx]['display_name'][:41-reduce]:{42-reduce}}{' ':1}{res[idx]['total']:>6.2f}{' ':1}{medal}")
+            return col2
+        
+        col1 = get_col1()
+        col2 = get_col2()
+        now = com.get_current_datetime().time().isoformat()
+        stamp = f'_Last Updated: {now}_'
+        desktop_dash = stamp + '```ansi\n'
+        for idx, _ in enumerate(col1):
+            div = '|'
+            if idx == 1:
+                div = '-'
+            desktop_dash += col1[idx] + div + col2[idx] + '\n'
+        desktop_dash += "```\n"
+        
+        mcol1 = get_col1(True)
+        mcol2 = get_col2(True)
+        mobile_dash = stamp + '```ansi\n'
+        for idx in range(len(mcol1)):
+            mobile_dash += mcol1[idx] + '\n'
+        mobile_dash += '\n' + get_seperator(True) + '\n'
+        for idx in range(len(mcol2)):
+            mobile_dash += mcol2[idx] + '\n'
+        mobile_dash += "```\n"
+        
+        
+        if not session_real:
+            desktop_dash += "Paused till session start. "
+            mobile_dash += "Paused till session start. "
             
-            def get_col2(mobile=False):
-                #Appending 2nd column
-                col2 = []
-                reduce = 0
-                if mobile:
-                    reduce = 10
-                seperator = get_seperator(mobile)
-                col2.append(f" Top {ex_lines+cont_lines} in Hours")
-                col2.append(seperator)
-                for idx in range(ex_lines+cont_lines):
-                    if idx >= len(res):
-                        col2.append(f"")
-                        continue
-                    match idx:
-                        case 0:
-                            medal='🥇'
-                        case 1:
-                            medal='🥈'
-                        case 2:
-                            medal='🥉'
-                        case _:
-                            medal=''
-                    col2.append(f"{' ' + res[idx]['display_name'][:41-reduce]:{42-reduce}}{' ':1}{res[idx]['total']:>6.2f}{' ':1}{medal}")
-                return col2
+            if self.open_transitioned.get(guild.id):
+                desktop_dash += "Camp is open!"
+                mobile_dash += "Camp is open!"
+                
+            await self._edit_dashboard(guild, self.dash_message[guild.id], stamp, desktop_dash)
             
-            col1 = get_col1()
-            col2 = get_col2()
-            now = com.get_current_datetime().time().isoformat()
-            desktop_dash = f'_Last Updated: {now}_```ansi\n'
-            for idx, _ in enumerate(col1):
-                div = '|'
-                if idx == 1:
-                    div = '-'
-                desktop_dash += col1[idx] + div + col2[idx] + '\n'
-            desktop_dash += "```\n"
             
-            mcol1 = get_col1(True)
-            mcol2 = get_col2(True)
-            mobile_dash = f'_Last Updated: {now}_```ansi\n'
-            for idx in range(len(mcol1)):
-                mobile_dash += mcol1[idx] + '\n'
-            mobile_dash += '\n' + get_seperator(True) + '\n'
-            for idx in range(len(mcol2)):
-                mobile_dash += mcol2[idx] + '\n'
-            mobile_dash += "```\n"
+            if mobile_channel and mobile_channel.permissions_for(guild.get_member(self.bot.user.id)).send_messages:
+                await self._edit_dashboard(guild, self.dash_mobile_message[guild.id], stamp, mobile_dash)
+            else:
+                print(f'{guild.id} mobile channel {mobile_channel} could not sent permissions or config not in')
             
+            self.delay[guild.id] = True
+        else:
+            await self._edit_dashboard(guild, self.dash_message[guild.id], stamp, desktop_dash)
             
-            if not session_real:
-                desktop_dash += "Paused till session start. "
-                mobile_dash += "Paused till session start. "
-                
-                if self.open_transitioned.get(guild.id):
-                    desktop_dash += "Camp is open!"
-                    mobile_dash += "Camp is open!"
-                    
-                await self.dash_message[guild.id].edit(content=desktop_dash)
-                
-                
-                if mobile_channel and mobile_channel.permissions_for(guild.get_member(self.bot.user.id)).send_messages:
-                    await self.dash_mobile_message[guild.id].edit(content=mobile_dash)
-                else:
-                    print(f'{guild.id} mobile channel {mobile_channel} could not sent permissions or config not in')
-                
-                self.delay[guild.id] = True
+            if mobile_channel and mobile_channel.permissions_for(guild.get_member(self.bot.user.id)).send_messages:
+                await self._edit_dashboard(guild, self.dash_mobile_message[guild.id], stamp, mobile_dash)
             else:
-                await self.dash_message[guild.id].edit(content=desktop_dash)
-                
-                if mobile_channel and mobile_channel.permissions_for(guild.get_member(self.bot.user.id)).send_messages:
-                    await self.dash_mobile_message[guild.id].edit(content=mobile_dash)
-                else:
-                    print(f'{guild.id} mobile channel {mobile_channel} could not sent permissions or config not in')
-                
-                self.open_transitioned[guild.id] = False
-                self.delay[guild.id] = False
-    
-    def get_config(self, guild_id):
-        now = com.get_current_datetime()
-        if self.cache_datetime and (now - self.cache_datetime).total_seconds() > 5 * com.SECS_IN_MINUTE:
-            self.refresh_cache_config()
-        if self.config_cache:
-            return self.config_cache.get(str(guild_id))
-        else:
-            return None
+                print(f'{guild.id} mobile channel {mobile_channel} could not sent permissions or config not in')
+            
+            self.open_transitioned[guild.id] = False
+            self.delay[guild.id] = False
     
-    def refresh_cache_config(self):
-        self.cache_datetime = com.get_current_datetime()
-        self.config_cache = json.load(open('data/config.json', 'r', encoding='utf-8'))
-        
+    # Skips the edit when nothing but the timestamp changed, unless the message has not been edited for DASH_MAX_STALENESS
+    async def _edit_dashboard(self, guild, message, stamp, content):
+        digest = hashlib.sha1(content[len(stamp):].encode('utf-8')).hexdigest()
+        stats = self.edit_stats.setdefault(guild.id, {'sent': 0, 'skipped': 0})
+        last = self.last_edit.get(message.id)
+        now = time.monotonic()
+        if last and last[0] == digest and now - last[1] < DASH_MAX_STALENESS:
+            stats['skipped'] += 1
+            return False
+        try:
+            await message.edit(content=content)
+        except discord.errors.NotFound:
+            # Deleted while we were running, forget it and reattach or repost like at startup
+            print(f'{com.get_current_iso()} [{guild.id}] - Dashboard message {message.id} is gone, reposting', flush=True)
+            self.last_edit.pop(message.id, None)
+            for kind, (config_key, messages) in self._dash_kinds().items():
+                if messages.get(guild.id) is message:
+                    messages.pop(guild.id, None)
+            await self._attach_dashboard(guild)
+            # Fill the new message without waiting for the heartbeat
+            self.bot.dispatch('urnby_state_change', guild.id, 'dashboard_repost')
+            return False
+        self.last_edit[message.id] = (digest, now)
+        stats['sent'] += 1
+        return True
 
-    
+    @printer.before_loop
+    async def before_printer(self):
+        await self.bot.wait_until_ready()
+        await configapi.load()
+
+    def get_config(self, guild_id):
+        return configapi.get_guild_config(guild_id)
 
 def setup(bot):
     bot.add_cog(Dashboard(bot))
@@ -10,6 +10,7 @@ from pycord.multicog import add_to_group
 
 # Internal
 import data.databaseapi as db
+import data.configapi as configapi
 import static.common as com
 from checks.IsAdmin import is_admin, NotAdmin
 from checks.IsCommandChannel import is_command_channel, NotCommandChannel
@@ -17,9 +18,7 @@ from checks.IsMemberVisible import is_member_visible, NotMemberVisible
 from checks.IsMember import is_member, NotMember
 from checks.IsInDev import is_in_dev, InDevelopment
 
-array_config = ["member_roles", "admin_roles", "command_channels", "channel_stats"]
-value_config = ["max_active", "dashboard_channel", "mobile_dash_channel"]
-special_config = ["bonus_hours"]
+from data.configapi import array_config, value_config, special_config
 
 class Misc(commands.Cog):
     
@@ -115,15 +114,13 @@ class Misc(commands.Cog):
                           _key: discord.Option(str, name="key", choices=array_config + value_config, required=True),
                           _value: discord.Option(str, name="value", required=True)):
         
-        guild_config = get_guild_config(str(ctx.guild.id))
         if _key in value_config:
-            guild_config[_key] = int(_value)
+            await configapi.set_value(ctx.guild.id, _key, int(_value))
         elif _key in array_config:
-            guild_config[_key].append(int(_value))
+            await configapi.add_item(ctx.guild.id, _key, int(_value))
         else:
             raise TypeError('configuration item type not found, contact administrator')
-        save_guild_config(str(ctx.guild.id), guild_config)
-        await ctx.send_response(content=f"Config item set - {_key} = {guild_config[_key]}")
+        await ctx.send_response(content=f"Config item set - {_key} = {configapi.get_guild_config(ctx.guild.id)[_key]}")
     
     @add_to_group('admin')
     @commands.slash_command(name='configaddbonushours', description='Add a set of bonus hours')
@@ -132,9 +129,6 @@ class Misc(commands.Cog):
                           _start: discord.Option(str, name="start", required=True),
                           _end: discord.Option(str, name="end", required=True),
                           _pct: discord.Option(int, name="pct", required=True)):
-        guild_config = get_guild_config(str(ctx.guild.id))
-        if not guild_config.get('bonus_hours'):
-            guild_config['bonus_hours'] = []
         try:
             _start = '0'+_start if len(_start) == 4 else _start
             _end = '0'+end if len(_end) == 4 else _end
@@ -145,18 +139,33 @@ class Misc(commands.Cog):
             await ctx.send_response(content=f"Invalid input for value: {err}")
             return
         
-        guild_config['bonus_hours'].append({"start":_start, "end":_end, "pct": _pct})
-        save_guild_config(str(ctx.guild.id), guild_config)
-        await ctx.send_response(content=f"Config item set - bonus_hours = {guild_config['bonus_hours']}")
+        bonus_hours = await configapi.append_value(ctx.guild.id, 'bonus_hours', {"start":_start, "end":_end, "pct": _pct})
+        await ctx.send_response(content=f"Config item set - bonus_hours = {bonus_hours}")
+    
+    @add_to_group('admin')
+    @commands.slash_command(name='configmobtimer', description='Set respawn timing for a mob, hours can be decimals')
+    @is_admin()
+    async def _config_mob_timer(self, ctx, 
+                          _mob: discord.Option(str, name="mobname", required=True),
+                          _respawn: discord.Option(float, name="respawn_hours", required=True),
+                          _camp: discord.Option(float, name="camp_hours", description="Hours before spawn that camp opens", required=True),
+                          _variance: discord.Option(float, name="variance_hours", description="Hours after respawn it may still spawn", default=0),
+                          _short: discord.Option(str, name="short", description="Short name for channel stats", default=None)):
+        if _respawn <= 0 or _camp < 0 or _variance < 0:
+            await ctx.send_response(content=f"Invalid input for value: hours must be positive")
+            return
+        entry = {"respawn_hours": _respawn, "camp_hours": _camp, "variance_hours": _variance}
+        if _short:
+            entry['short'] = _short
+        mob_timers = await configapi.merge_value(ctx.guild.id, 'mob_timers', _mob, entry)
+        await ctx.send_response(content=f"Config item set - mob_timers = {mob_timers}")
     
     @add_to_group('admin')
     @commands.slash_command(name='configclearitem', description='Clear a configuration item, will need to set values again')
     @is_admin()
     async def _config_clear_item(self, ctx, _key: discord.Option(name="key", choices=array_config+value_config+special_config, required=True)):
-        guild_config = get_guild_config(str(ctx.guild.id))
-        guild_config[_key] = ""
-        save_guild_config(str(ctx.guild.id), guild_config)
-        await ctx.send_response(content=f"Config item cleared - {_key} = {guild_config[_key]}")
+        await configapi.clear_item(ctx.guild.id, _key)
+        await ctx.send_response(content=f"Config item cleared - {_key} = {configapi.get_guild_config(ctx.guild.id).get(_key, '')}")
     
     @add_to_group('admin')
     @commands.slash_command(name='echo', description='Echo echo echo......')
@@ -165,22 +174,6 @@ class Misc(commands.Cog):
         await ctx.channel.send(content=content)
         await ctx.send_response(content="Your word is my command", ephemeral=True)
 
-def get_guild_config(guild_id):
-    config = json.load(open('data/config.json', 'r', encoding='utf-8'))
-    guild_config = config.get(str(guild_id))
-    if not guild_config:
-        guild_config = {}
-    return guild_config
-
-def save_guild_config(guild_id, new_guild_config):
-    config = get_config()
-    config[guild_id] = new_guild_config
-    json.dump(config, open('data/config.json', 'w', encoding='utf-8'), indent=1)
-    return True
-
-def get_config():
-    return json.load(open('data/config.json', 'r', encoding='utf-8'))
-
 def setup(bot):
     bot.add_cog(Misc(bot))
 
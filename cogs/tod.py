@@ -4,12 +4,15 @@ import json
 
 # External
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from pycord.multicog import add_to_group
 
 # Internal
 import static.common as com
 import data.databaseapi as db
+import data.configapi as configapi
+import static.spawntimers as spawntimers
+import static.channels as channels
 from views.ClearOutView import ClearOutView
 from checks.IsAdmin import is_admin, NotAdmin
 from checks.IsCommandChannel import is_command_channel, NotCommandChannel
@@ -21,22 +24,67 @@ class Tod(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        spawntimers.on_event(self.on_spawn_event)
+        self.timer_engine.start()
         print('Initilization on tod complete')
 
+    def cog_unload(self):
+        spawntimers.remove_listener(self.on_spawn_event)
+        self.timer_engine.cancel()
+
     @commands.Cog.listener()
     async def on_ready(self):
         missing_tables = await db.check_tables(['tod'])
         if missing_tables:
             print(f"Warning, ToD reports missing the following tables in db: {missing_tables}")
+
+    # Started with the cog rather than on_ready so a reload brings the engine back up
+    @tasks.loop(seconds=1)
+    async def timer_engine(self):
+        await spawntimers.run()
+
+    @timer_engine.before_loop
+    async def before_timer_engine(self):
+        await self.bot.wait_until_ready()
+        await configapi.load()
+        for guild in self.bot.guilds:
+            await spawntimers.load(guild.id)
+
+    # Pushed by the timer engine as a mob's camp opens, it spawns and its window expires
+    async def on_spawn_event(self, guild_id, mob, event, timer):
+        print(f"{com.get_current_iso()} [{guild_id}] - Spawn timer {mob} {event}", flush=True)
+        self.bot.dispatch('urnby_spawn_event', guild_id, mob, event)
+        self.bot.dispatch('urnby_state_change', guild_id, f'spawn_{event}')
+        config = configapi.get_guild_config(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        if not guild or not config or not config.get('spawn_alert_channel'):
+            return
+        channel = await channels.get_channel(guild, config['spawn_alert_channel'])
+        if not channel:
+            return
+        spawn = com.datetime_from_timestamp(timer.spawn_timestamp).strftime('%H:%M')
+        if event == 'open':
+            content = f"{mob} camp is open, spawn at {spawn} {com.get_timezone_str()}"
+        elif event == 'spawn' and timer.expire_timestamp > timer.spawn_timestamp:
+            content = f"{mob} is in its spawn window until {com.datetime_from_timestamp(timer.expire_timestamp).strftime('%H:%M')} {com.get_timezone_str()}"
+        elif event == 'spawn':
+            content = f"{mob} is up"
+        else:
+            content = f"{mob} spawn window has closed, ToD unknown"
+        try:
+            await channel.send(content=content)
+        except discord.errors.HTTPException as err:
+            print(f"{com.get_current_iso()} [{guild_id}] - Spawn alert for {mob} failed: {err}", flush=True)
     
     @commands.slash_command(name='todnow', description='Simplified tod, takes required parameter of minutes ago')
-    async def _tod_now(self, ctx, ago: discord.Option(int, name='minutes_ago', description="Minutes since tod, can be 0" , required=True)):
+    async def _tod_now(self, ctx, ago: discord.Option(int, name='minutes_ago', description="Minutes since tod, can be 0" , required=True),
+                       mobname: discord.Option(str, name='mobname', default=spawntimers.DEFAULT_MOB)):
         now = com.get_current_datetime()
             
         tod_datetime = now - datetime.timedelta(minutes=ago)
             
         rec = {
-               "mob": 'Drusella Sathir', 
+               "mob": mobname, 
                "tod_timestamp": tod_datetime.timestamp(), 
                "submitted_timestamp": now.timestamp(), 
                "submitted_by_id": ctx.author.id,
@@ -45,13 +93,15 @@ class Tod(commands.Cog):
                "_DEBUG_tod_datetime": tod_datetime.isoformat(), 
                }
         row = await db.store_tod(ctx.guild.id, rec)
-        await ctx.send_response(content=f"Set tod at {rec['_DEBUG_tod_datetime']}, spawn will happen at {(tod_datetime+datetime.timedelta(days=1)).isoformat()}")
+        timer = await spawntimers.set_tod(ctx.guild.id, rec)
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'tod')
+        await ctx.send_response(content=f"Set tod at {rec['_DEBUG_tod_datetime']}, spawn will happen at {com.datetime_from_timestamp(timer.spawn_timestamp).isoformat()}")
         return
         
     @commands.slash_command(name='settod', description='Set tod to a more specific time, with optional parameter for yesterday')
     async def _settod(self, ctx, 
                        tod: discord.Option(str, name='tod', description="Use when time is not 'now' - 24hour clock time EST (ex 14:49)" , default='now'),
-                       mobname: discord.Option(str, name='mobname', default='Drusella Sathir'),
+                       mobname: discord.Option(str, name='mobname', default=spawntimers.DEFAULT_MOB),
                        daybefore: discord.Option(bool, name='daybefore', description='Use if the tod was actually yesterday',  default=False)):
         now = com.get_current_datetime()
         tod_datetime = {}
@@ -77,19 +127,31 @@ class Tod(commands.Cog):
                "_DEBUG_tod_datetime": tod_datetime.isoformat(), 
                }
         row = await db.store_tod(ctx.guild.id, rec)
-        await ctx.send_response(content=f"Set tod at {rec['_DEBUG_tod_datetime']}, spawn will happen at {(tod_datetime+datetime.timedelta(days=1)).isoformat()}")
+        timer = await spawntimers.set_tod(ctx.guild.id, rec)
+        self.bot.dispatch('urnby_state_change', ctx.guild.id, 'tod')
+        await ctx.send_response(content=f"Set tod at {rec['_DEBUG_tod_datetime']}, spawn will happen at {com.datetime_from_timestamp(timer.spawn_timestamp).isoformat()}")
         return
     
     @add_to_group('get')
-    @commands.slash_command(name='tod', description='Get current ToD record')
-    async def _get_tod(self, ctx):
-        rec = await db.get_tod(ctx.guild.id)
-        now = com.get_current_datetime()
-        hours_till = com.get_hours_from_secs((com.datetime_from_timestamp(rec['tod_timestamp'])+datetime.timedelta(days=1)).timestamp() - now.timestamp())
-        if not hours_till:
-            await ctx.send_response(content=f"Last ToD was {rec['_DEBUG_tod_datetime']} unknown upcoming spawn", ephemeral=True)
+    @commands.slash_command(name='tod', description='Get current ToD records')
+    async def _get_tod(self, ctx, mobname: discord.Option(str, name='mobname', description='Defaults to every mob with a ToD', default=None)):
+        timers = await spawntimers.get_timers(ctx.guild.id)
+        if mobname:
+            timers = [timer for timer in timers if timer.mob == mobname]
+        if not timers:
+            await ctx.send_response(content=f"No ToD recorded", ephemeral=True)
             return
-        await ctx.send_response(content=f"Last ToD was {rec['_DEBUG_tod_datetime']} {rec['mob']} will spawn in {hours_till} hours", ephemeral=True)
+        now = com.get_current_timestamp()
+        lines = []
+        for timer in timers:
+            state = timer.state(now)
+            if state == 'unknown':
+                lines.append(f"Last ToD was {timer.tod['_DEBUG_tod_datetime']} {timer.mob} unknown upcoming spawn")
+            elif state == 'window':
+                lines.append(f"Last ToD was {timer.tod['_DEBUG_tod_datetime']} {timer.mob} is in its spawn window for {com.get_hours_from_secs(timer.expire_timestamp - now)} hours")
+            else:
+                lines.append(f"Last ToD was {timer.tod['_DEBUG_tod_datetime']} {timer.mob} will spawn in {com.get_hours_from_secs(timer.spawn_timestamp - now)} hours")
+        await ctx.send_response(content='\n'.join(lines), ephemeral=True)
 
 async def time_delta_to_minutes(delta:datetime.timedelta) -> float:
     secs = delta.total_seconds()
@@ -0,0 +1,78 @@
+import os
+import glob
+import time
+import sqlite3
+import datetime
+
+import aiosqlite
+import static.common as com
+from data.databaseapi import DB_PATH
+
+BACKUP_DIR = os.getenv('DB_BACKUP_DIR', 'data/backups')
+BACKUP_RETENTION = int(os.getenv('DB_BACKUP_RETENTION', 24))
+# Pages copied per backup step, the source is unlocked and writers can commit between steps
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+BACKUP_PREFIX = 'urnby-'
+
+last_backup = None
+
+def list_snapshots() -> list[str]:
+    return sorted(glob.glob(os.path.join(BACKUP_DIR, f'{BACKUP_PREFIX}*.db')))
+
+def latest_snapshot():
+    snapshots = list_snapshots()
+    if not snapshots:
+        return None
+    return snapshots[-1]
+
+def snapshot_timestamp(path) -> int:
+    return int(os.path.getmtime(path))
+
+def prune_snapshots(retention=None) -> list[str]:
+    if retention is None:
+        retention = BACKUP_RETENTION
+    snapshots = list_snapshots()
+    removed = snapshots[:-retention] if retention > 0 else []
+    for path in removed:
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return removed
+
+# Copies the live database with sqlite's online backup API into a new timestamped snapshot
+async def create_snapshot() -> dict:
+    global last_backup
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    # Named in UTC so names sort in creation order across the DST fall back hour
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    path = os.path.join(BACKUP_DIR, f'{BACKUP_PREFIX}{now.strftime("%Y%m%dT%H%M%SZ")}.db')
+    partial = path + '.partial'
+    start = time.monotonic()
+    # The backup runs on the source connection's thread, so the target must allow use from it
+    target = sqlite3.connect(partial, check_same_thread=False)
+    try:
+        try:
+            async with aiosqlite.connect(DB_PATH) as source:
+                await source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+            # The copy inherits WAL mode, switch back so the snapshot is a single self contained file
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        os.replace(partial, path)
+    except BaseException:
+        # list_snapshots never matches a .partial, so a failed copy would otherwise stay on disk for good
+        for suffix in ['', '-wal', '-shm', '-journal']:
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        raise
+    removed = prune_snapshots()
+    last_backup = {
+        'path': path,
+        'timestamp': int(now.timestamp()),
+        'duration': round(time.monotonic() - start, 3),
+        'size': os.path.getsize(path),
+        'pruned': len(removed),
+    }
+    print(f"{com.get_current_iso()} - Database snapshot {path} took {last_backup['duration']}s, {last_backup['size']} bytes, pruned {len(removed)}", flush=True)
+    return last_backup
@@ -0,0 +1,59 @@
+import asyncio
+
+FLUSH_SIZE = 50
+FLUSH_DELAY = 2.0
+
+# In memory buffer for the command audit log. Entries are handed to flush_fn in bulk once FLUSH_SIZE
+# entries are queued or FLUSH_DELAY seconds after the first unflushed entry, whichever comes first.
+class CommandLog:
+    def __init__(self, flush_fn, flush_size=FLUSH_SIZE, flush_delay=FLUSH_DELAY):
+        self.flush_fn = flush_fn
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+        self._entries = []
+        self._timer = None
+        # The loop only keeps weak references to tasks, size triggered flushes are held here until done
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self.flushed = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._entries)
+
+    def append(self, entry):
+        self._entries.append(entry)
+        if len(self._entries) >= self.flush_size:
+            task = asyncio.create_task(self.flush())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._entries:
+                return 0
+            entries, self._entries = self._entries, []
+            try:
+                await self.flush_fn(entries)
+            except Exception as err:
+                # Keep the entries so the next flush retries them
+                print(f"Failed flushing {len(entries)} command log entries, will retry: {err}", flush=True)
+                self._entries = entries + self._entries
+                if not self._closed and (self._timer is None or self._timer.done() or self._timer is asyncio.current_task()):
+                    self._timer = asyncio.create_task(self._flush_later())
+                return 0
+            self.flushed += len(entries)
+            return len(entries)
+
+    async def close(self):
+        self._closed = True
+        if self._timer and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        await self.flush()
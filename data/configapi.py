@@ -0,0 +1,119 @@
+import json
+import asyncio
+
+import data.databaseapi as db
+from static.common import get_current_iso
+
+array_config = ["member_roles", "admin_roles", "command_channels", "channel_stats"]
+value_config = ["max_active", "dashboard_channel", "mobile_dash_channel", "spawn_alert_channel"]
+special_config = ["bonus_hours", "mob_timers"]
+
+# In memory copy of the guild_config tables keyed by str(guild_id), loaded once and refreshed per guild after each write
+_config = {}
+_loaded = False
+_load_lock = asyncio.Lock()
+_subscribers = []
+
+async def _read_guild_config(conn, guild_id) -> dict:
+    guild_config = {key: [] for key in array_config}
+    async with conn.execute("""SELECT key, value FROM guild_config WHERE server = ?""", (int(guild_id),)) as cursor:
+        for row in await cursor.fetchall():
+            guild_config[row['key']] = json.loads(row['value'])
+    async with conn.execute("""SELECT key, value FROM guild_config_items WHERE server = ? ORDER BY rowid""", (int(guild_id),)) as cursor:
+        for row in await cursor.fetchall():
+            guild_config.setdefault(row['key'], []).append(row['value'])
+    return guild_config
+
+async def load(force=False) -> dict:
+    global _config, _loaded
+    async with _load_lock:
+        if _loaded and not force:
+            return _config
+        await db.init_database()
+        config = {}
+        async with db.connect() as conn:
+            query = """SELECT server FROM guild_config UNION SELECT server FROM guild_config_items"""
+            async with conn.execute(query) as cursor:
+                guild_ids = [row[0] for row in await cursor.fetchall()]
+            for guild_id in guild_ids:
+                config[str(guild_id)] = await _read_guild_config(conn, guild_id)
+        _config = config
+        _loaded = True
+    print(f"{get_current_iso()} - Loaded config for {len(_config)} guilds", flush=True)
+    return _config
+
+# callback(guild_id, key) is called after every config write
+def subscribe(callback):
+    _subscribers.append(callback)
+
+async def _changed(guild_id, key):
+    async with db.connect() as conn:
+        _config[str(guild_id)] = await _read_guild_config(conn, guild_id)
+    for callback in _subscribers:
+        try:
+            res = callback(int(guild_id), key)
+            if asyncio.iscoroutine(res):
+                await res
+        except Exception as err:
+            print(f"{get_current_iso()} [{guild_id}] - Config subscriber failed for {key}: {err}", flush=True)
+
+# Returned objects are the shared cache, do not modify them
+def get_config() -> dict:
+    return _config
+
+def get_guild_config(guild_id):
+    return _config.get(str(guild_id))
+
+async def set_value(guild_id, key, value):
+    query = """INSERT INTO guild_config(server, key, value) VALUES(?, ?, ?) ON CONFLICT(server, key) DO UPDATE SET value = excluded.value"""
+    await db.execute_write(query, (int(guild_id), key, json.dumps(value)))
+    await _changed(guild_id, key)
+
+# Returns False when the value was already in the list
+async def add_item(guild_id, key, value) -> bool:
+    async def job(conn):
+        query = """INSERT OR IGNORE INTO guild_config_items(server, key, value) VALUES(?, ?, ?)"""
+        async with conn.execute(query, (int(guild_id), key, value)) as cursor:
+            return cursor.rowcount > 0
+    added = await db.submit_write(job)
+    await _changed(guild_id, key)
+    return added
+
+# Appends to a json list value, read and write happen in one writer job so concurrent appends are not lost
+async def append_value(guild_id, key, entry) -> list:
+    async def job(conn):
+        async with conn.execute("""SELECT value FROM guild_config WHERE server = ? AND key = ?""", (int(guild_id), key)) as cursor:
+            row = await cursor.fetchone()
+        values = json.loads(row['value']) if row else []
+        if not isinstance(values, list):
+            values = []
+        values.append(entry)
+        query = """INSERT INTO guild_config(server, key, value) VALUES(?, ?, ?) ON CONFLICT(server, key) DO UPDATE SET value = excluded.value"""
+        await conn.execute(query, (int(guild_id), key, json.dumps(values)))
+        return values
+    values = await db.submit_write(job)
+    await _changed(guild_id, key)
+    return values
+
+# Sets entry under name in a json object value, read and write happen in one writer job like append_value
+async def merge_value(guild_id, key, name, entry) -> dict:
+    async def job(conn):
+        async with conn.execute("""SELECT value FROM guild_config WHERE server = ? AND key = ?""", (int(guild_id), key)) as cursor:
+            row = await cursor.fetchone()
+        values = json.loads(row['value']) if row else {}
+        if not isinstance(values, dict):
+            values = {}
+        values[name] = entry
+        query = """INSERT INTO guild_config(server, key, value) VALUES(?, ?, ?) ON CONFLICT(server, key) DO UPDATE SET value = excluded.value"""
+        await conn.execute(query, (int(guild_id), key, json.dumps(values)))
+        return values
+    values = await db.submit_write(job)
+    await _changed(guild_id, key)
+    return values
+
+async def clear_item(guild_id, key):
+    async def job(conn):
+        await conn.execute("""DELETE FROM guild_config WHERE server = ? AND key = ?""", (int(guild_id), key))
+        await conn.execute("""DELETE FROM guild_config_items WHERE server = ? AND key = ?""", (int(guild_id), key))
+    await db.submit_write(job)
+    await _changed(guild_id, key)
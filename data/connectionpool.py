@@ -0,0 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+# Applied to every connection the pool opens
+DEFAULT_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+]
+
+class PoolClosed(Exception):
+    pass
+
+class ConnectionPool:
+    def __init__(self, path, size=4, pragmas=None):
+        self.path = path
+        self.size = size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self._idle = asyncio.Queue()
+        self._connections = []
+        self._closed = False
+
+    async def open(self):
+        for _ in range(self.size):
+            conn = await self._connect()
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+        return self
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in self.pragmas:
+            await conn.execute(pragma)
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._closed:
+            raise PoolClosed(f'Connection pool for {self.path} is closed')
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            # Never hand the next caller a connection with a half finished transaction
+            if conn.in_transaction:
+                try:
+                    await conn.rollback()
+                except aiosqlite.Error:
+                    pass
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        self._closed = True
+        # Wait for borrowed connections to come back before closing them
+        for _ in range(len(self._connections)):
+            conn = await self._idle.get()
+            await conn.close()
+        self._connections = []
@@ -1,9 +1,79 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
 import aiosqlite
 from static.common import get_hours_from_secs, get_current_timestamp
+from data.connectionpool import ConnectionPool, DEFAULT_PRAGMAS
+from data.migrations import run_migrations
+from data.writer import DatabaseWriter
+from data.commandlog import CommandLog
+
+DB_PATH = os.getenv('DB_PATH', 'data/urnby.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+DB_CLOSE_TIMEOUT = 10
+
+_pool = None
+_writer = None
+_pool_lock = asyncio.Lock()
+_init_lock = asyncio.Lock()
+_initialized = False
+
+    # ==============================================================================
+    # Connection management
+    # ==============================================================================
+
+async def get_pool() -> ConnectionPool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await ConnectionPool(DB_PATH, size=DB_POOL_SIZE).open()
+            print(f"Database pool opened with {DB_POOL_SIZE} connections to {DB_PATH}", flush=True)
+    return _pool
+
+async def get_writer() -> DatabaseWriter:
+    global _writer
+    async with _pool_lock:
+        if _writer is None:
+            _writer = await DatabaseWriter(DB_PATH, pragmas=DEFAULT_PRAGMAS).start()
+    return _writer
+
+# All writes go through the single writer task, job is an async callable taking the connection and must not commit
+async def submit_write(job):
+    writer = _writer or await get_writer()
+    return await writer.submit(job)
+
+async def execute_write(query, params=()) -> int:
+    writer = _writer or await get_writer()
+    return await writer.execute(query, params)
+
+@asynccontextmanager
+async def connect():
+    pool = _pool or await get_pool()
+    async with pool.acquire() as db:
+        yield db
+
+async def close_database():
+    global _pool, _writer, _initialized
+    await _command_log.close()
+    async with _pool_lock:
+        if _writer is not None:
+            await _writer.close()
+            _writer = None
+        if _pool is None:
+            return
+        try:
+            await asyncio.wait_for(_pool.close(), timeout=DB_CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Timed out waiting for database connections to be returned, closing anyway", flush=True)
+        _pool = None
+        _initialized = False
+    print(f"Database pool closed", flush=True)
 
 async def check_tables(tbls):
     l = []
-    async with aiosqlite.connect('data/urnby.db') as db:
+    async with connect() as db:
         query = "SELECT name FROM sqlite_master WHERE type='table';"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -13,43 +83,24 @@ async def check_tables(tbls):
         return []
     return set(tbls) - set(l)
         
+# Safe to call from every startup path, migrations only run on the first call
 async def init_database():
-    async with aiosqlite.connect('data/urnby.db') as db:
-        tables = [
-        """CREATE TABLE IF NOT EXISTS "historical"(server, user, character, session, in_timestamp, out_timestamp, _DEBUG_user_name, _DEBUG_in, _DEBUG_out, _DEBUG_delta);""",
-        """CREATE TABLE IF NOT EXISTS "session"(server, session, created_by, _DEBUG_started_by, _DEBUG_start, start_timestamp, ended_by, _DEBUG_ended_by, _DEBUG_end, end_timestamp, _DEBUG_delta);""",
-        """CREATE TABLE IF NOT EXISTS "session_history"(server, session, created_by, _DEBUG_started_by, _DEBUG_start, start_timestamp, ended_by, _DEBUG_ended_by, _DEBUG_end, end_timestamp,      _DEBUG_delta);""",
-        """CREATE TABLE IF NOT EXISTS "active"(server, user, character, session, in_timestamp, out_timestamp, _DEBUG_user_name, _DEBUG_in, _DEBUG_out, _DEBUG_delta);""",
-        """CREATE TABLE IF NOT EXISTS "commands"(server, command_name, options, datetime, user, user_name, channel_name);""",
-        """CREATE TABLE IF NOT EXISTS "tod"(server, mob, tod_timestamp, submitted_timestamp, submitted_by_id, _DEBUG_submitted_datetime, _DEBUG_submitted_by, _DEBUG_tod_datetime);""",
-        """CREATE TABLE IF NOT EXISTS "reps"(server, user, name, in_timestamp, UNIQUE(server, user));""",
-        ]
-        for query in tables:
-            await db.execute(query)
-        await db.commit()
-
-async def flush_wal():
-    async with aiosqlite.connect('data/urnby.db') as db:
-        try:
-            query = f"""PRAGMA journal_mode = DELETE"""
-            res = await db.execute(query)
-            await db.commit()
-            print(f"Database mode set to: {await res.fetchall()}", flush=True)
-            query = f"""PRAGMA journal_mode = WAL"""
-            res = await db.execute(query)
-            await db.commit()
-            print(f"Database mode set to: {await res.fetchall()}", flush=True)
-        except aiosqlite.OperationalError as err:
-            print(f"Failed flushing WAL, are there multiple connections to the database?", flush=True)
-            return False
-    return True
+    global _initialized
+    async with _init_lock:
+        if _initialized:
+            return
+        await get_pool()
+        async with connect() as db:
+            version = await run_migrations(db)
+        print(f"Database schema at version {version}", flush=True)
+        await get_writer()
+        _initialized = True
 
 async def set_db_to_wal():
-    async with aiosqlite.connect('data/urnby.db') as db:
+    async with connect() as db:
             query = f"PRAGMA journal_mode=WAL"
             res = await db.execute(query)
             print(f"Database mode set to: {await res.fetchall()}",flush=True)
-            await db.commit() 
             
     # ==============================================================================
     # Session (session or session_history tables)
@@ -57,8 +108,7 @@ async def set_db_to_wal():
     
 async def get_session(guild_id):
     res = {}
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM session WHERE server = {guild_id}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -70,9 +120,7 @@ async def get_session(guild_id):
     return res
     
 async def set_session(guild_id, session):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async def job(db):
         # Only one session allowed per server
         query = f"""SELECT count(*) FROM session WHERE server = {guild_id}"""
         async with db.execute(query) as cursor:
@@ -89,14 +137,11 @@ async def set_session(guild_id, session):
         query = f"""INSERT INTO session(server,      session,  created_by,  _DEBUG_started_by,  _DEBUG_start,  start_timestamp,  ended_by,  _DEBUG_ended_by,  _DEBUG_end,  end_timestamp,  _DEBUG_delta)
                                  VALUES({guild_id}, :session, :created_by, :_DEBUG_started_by, :_DEBUG_start, :start_timestamp, :ended_by, :_DEBUG_ended_by, :_DEBUG_end, :end_timestamp, :_DEBUG_delta)"""
         async with db.execute(query, session) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+            return cursor.lastrowid
+    return await submit_write(job)
 
 async def delete_session(guild_id):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async def job(db):
         query = f"""SELECT count(*) FROM session WHERE server = {guild_id}"""
         async with db.execute(query) as cursor:
             res = await cursor.fetchall()
@@ -104,25 +149,73 @@ async def delete_session(guild_id):
                 return None
         query = f"""DELETE FROM session WHERE server = {guild_id}"""
         async with db.execute(query) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+            return cursor.lastrowid
+    return await submit_write(job)
 
 
 async def store_historical_session(guild_id, session):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
+    query = f"""INSERT INTO session_history(server,      session,  created_by,  _DEBUG_started_by,  _DEBUG_start,  start_timestamp,  ended_by,  _DEBUG_ended_by,  _DEBUG_end,  end_timestamp,  _DEBUG_delta)
+                                     VALUES({guild_id}, :session, :created_by, :_DEBUG_started_by, :_DEBUG_start, :start_timestamp, :ended_by, :_DEBUG_ended_by, :_DEBUG_end, :end_timestamp, :_DEBUG_delta)"""
+    return await execute_write(query, session)
+
+# Moves every active record to historical, stores bonus rows from bonus_fn([(record, row)]), archives the session
+# and clears the replacement queue in one transaction. Returns None if there was no session to close
+async def close_session(guild_id, session, out_datetime, bonus_fn=None) -> dict:
+    historical_query = f"""INSERT INTO historical(server,      user,  character,  session,  in_timestamp,  out_timestamp,  _DEBUG_user_name,  _DEBUG_in,  _DEBUG_out,  _DEBUG_delta)
+                                           VALUES({guild_id}, :user, :character, :session, :in_timestamp, :out_timestamp, :_DEBUG_user_name, :_DEBUG_in, :_DEBUG_out, :_DEBUG_delta)"""
+
+    # The writer holds the only write lock, so rows inserted by one executemany get ascending rowids after the current max
+    async def insert_many(db, records) -> list[int]:
+        async with db.execute("SELECT IFNULL(MAX(rowid), 0) FROM historical") as cursor:
+            before = (await cursor.fetchone())[0]
+        await db.executemany(historical_query, records)
+        query = f"SELECT rowid FROM historical WHERE rowid > {before} ORDER BY rowid ASC"
+        async with db.execute(query) as cursor:
+            return [row['rowid'] for row in await cursor.fetchall()]
+
+    async def job(db):
+        query = f"""SELECT count(*) FROM session WHERE server = {guild_id}"""
+        async with db.execute(query) as cursor:
+            res = await cursor.fetchall()
+            if dict(res[0])['count(*)'] != 1:
+                return None
+
+        query = f"SELECT rowid, * FROM active WHERE server = {guild_id}"
+        async with db.execute(query) as cursor:
+            records = [dict(row) for row in await cursor.fetchall()]
+        for record in records:
+            record['out_timestamp'] = int(out_datetime.timestamp())
+            record['_DEBUG_out'] = out_datetime.isoformat()
+            record['_DEBUG_delta'] = get_hours_from_secs(record['out_timestamp'] - record['in_timestamp'])
+
+        closed = []
+        if records:
+            rows = await insert_many(db, records)
+            closed = list(zip(records, rows))
+
+        bonuses = []
+        if bonus_fn and closed:
+            bonuses = bonus_fn(closed) or []
+        bonus_closed = []
+        if bonuses:
+            rows = await insert_many(db, bonuses)
+            bonus_closed = list(zip(bonuses, rows))
+
+        await db.execute(f"""DELETE FROM active WHERE server = {guild_id}""")
         query = f"""INSERT INTO session_history(server,      session,  created_by,  _DEBUG_started_by,  _DEBUG_start,  start_timestamp,  ended_by,  _DEBUG_ended_by,  _DEBUG_end,  end_timestamp,  _DEBUG_delta)
                                          VALUES({guild_id}, :session, :created_by, :_DEBUG_started_by, :_DEBUG_start, :start_timestamp, :ended_by, :_DEBUG_ended_by, :_DEBUG_end, :end_timestamp, :_DEBUG_delta)"""
-        async with db.execute(query, session) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+        await db.execute(query, session)
+        await db.execute(f"""DELETE FROM session WHERE server = {guild_id}""")
+        await db.execute(f"""DELETE FROM reps WHERE server = {guild_id}""")
+        return {'closed': closed, 'bonuses': bonus_closed}
+    res = await submit_write(job)
+    if res and (res['closed'] or res['bonuses']):
+        _historical_changed(guild_id)
+    return res
 
 async def get_last_rows_historical_session(guild_id, count):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM session_history WHERE server = {guild_id} ORDER BY rowid DESC LIMIT {count}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -132,11 +225,20 @@ async def get_last_rows_historical_session(guild_id, count):
     # ==============================================================================
     # Records (active or historical tables)
     # ==============================================================================
+
+# callback(guild_id) runs after every committed write to historical, guild_id is None when every guild changed
+_historical_listeners = []
+
+def on_historical_change(callback):
+    _historical_listeners.append(callback)
+
+def _historical_changed(guild_id):
+    for callback in _historical_listeners:
+        callback(guild_id)
     
 async def get_all_actives(guild_id) -> list:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT rowid, * FROM active WHERE server = {guild_id}"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -144,8 +246,7 @@ async def get_all_actives(guild_id) -> list:
     return res
 
 async def is_user_active(guild_id, user_id) -> bool:
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT count(*) FROM active WHERE server = {guild_id} AND user = {user_id}"
         async with db.execute(query) as cursor:
             res = await cursor.fetchall()
@@ -153,39 +254,35 @@ async def is_user_active(guild_id, user_id) -> bool:
 
 # Returns None if user was already in active
 async def store_active_record(guild_id, record):
-    guild_actives = await get_all_actives(str(guild_id))
-    for item in guild_actives:
-        if item['user'] == record['user']:
-            return None
-            
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
+    async def job(db):
+        query = f"SELECT count(*) FROM active WHERE server = {guild_id} AND user = {record['user']}"
+        async with db.execute(query) as cursor:
+            res = await cursor.fetchall()
+            if dict(res[0])['count(*)'] != 0:
+                return None
         query = f"""INSERT INTO active(server,      user,  character,  session,  in_timestamp,  out_timestamp,  _DEBUG_user_name,  _DEBUG_in,  _DEBUG_out,  _DEBUG_delta)
                                 VALUES({guild_id}, :user, :character, :session, :in_timestamp, :out_timestamp, :_DEBUG_user_name, :_DEBUG_in, :_DEBUG_out, :_DEBUG_delta)"""
         async with db.execute(query, record) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+            return cursor.lastrowid
+    return await submit_write(job)
 
 # Returns None if user not in active
 async def remove_active_record(guild_id, record):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
-
-        if not await is_user_active(guild_id, record['user']):
-            return None
+    async def job(db):
+        query = f"SELECT count(*) FROM active WHERE server = {guild_id} AND user = {record['user']}"
+        async with db.execute(query) as cursor:
+            res = await cursor.fetchall()
+            if dict(res[0])['count(*)'] == 0:
+                return None
 
         query = f"""DELETE FROM active WHERE server = {guild_id} AND user = {record['user']}"""
         async with db.execute(query) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+            return cursor.lastrowid
+    return await submit_write(job)
 
 async def get_historical_session(guild_id, session_name):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM historical WHERE server = {guild_id} AND session = '{session_name}'"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -194,8 +291,7 @@ async def get_historical_session(guild_id, session_name):
 
 async def get_historical(guild_id):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT rowid, * FROM historical WHERE server = {guild_id}"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -204,8 +300,7 @@ async def get_historical(guild_id):
     
 async def get_last_rows_historical(guild_id, count):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM historical WHERE server = {guild_id} ORDER BY rowid DESC LIMIT {count}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -214,62 +309,92 @@ async def get_last_rows_historical(guild_id, count):
 
 async def get_historical_user(guild_id, user_id):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT rowid, * FROM historical WHERE server = {guild_id} AND user = {user_id}"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
             res = [dict(row) for row in rows]
     return res
     
+# Keyset page of a user's historical records, oldest first, starting after after_rowid
+async def get_historical_user_page(guild_id, user_id, after_rowid=None, count=10) -> list[dict]:
+    res = []
+    keyset = f"AND rowid > {int(after_rowid)}" if after_rowid is not None else ''
+    async with connect() as db:
+        query = f"SELECT rowid, * FROM historical WHERE server = {guild_id} AND user = {user_id} {keyset} ORDER BY rowid ASC LIMIT {int(count)}"
+        async with db.execute(query) as cursor:
+            rows = await cursor.fetchall()
+            res = [dict(row) for row in rows]
+    return res
+    
 async def get_historical_record(guild_id, rowid):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT rowid, * FROM historical WHERE server = {guild_id} AND rowid = {rowid}"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
             res = [dict(row) for row in rows]
-        await db.commit()
     return res
     
 async def store_new_historical(guild_id, record):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        query = f"""INSERT INTO historical(server,      user,  character,  session,  in_timestamp,  out_timestamp,  _DEBUG_user_name,  _DEBUG_in,  _DEBUG_out,  _DEBUG_delta)
-                                    VALUES({guild_id}, :user, :character, :session, :in_timestamp, :out_timestamp, :_DEBUG_user_name, :_DEBUG_in, :_DEBUG_out, :_DEBUG_delta)"""
-        async with db.execute(query, record) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+    query = f"""INSERT INTO historical(server,      user,  character,  session,  in_timestamp,  out_timestamp,  _DEBUG_user_name,  _DEBUG_in,  _DEBUG_out,  _DEBUG_delta)
+                                VALUES({guild_id}, :user, :character, :session, :in_timestamp, :out_timestamp, :_DEBUG_user_name, :_DEBUG_in, :_DEBUG_out, :_DEBUG_delta)"""
+    row = await execute_write(query, record)
+    _historical_changed(guild_id)
+    return row
 
 async def delete_historical_record(guild_id, rowid):
-    res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
+    async def job(db):
         query = f"DELETE FROM historical WHERE server = {guild_id} AND rowid = {rowid}"
         async with db.execute(query) as cursor:
-            res = await cursor.fetchall()
-        await db.commit()
+            return await cursor.fetchall()
+    res = await submit_write(job)
+    _historical_changed(guild_id)
     return res
+
+# Swaps recomputed bonus records in one transaction, returns the new rowids
+async def replace_bonus_records(guild_id, delete_rowids, records) -> list[int]:
+    query = f"""INSERT INTO historical(server,      user,  character,  session,  in_timestamp,  out_timestamp,  _DEBUG_user_name,  _DEBUG_in,  _DEBUG_out,  _DEBUG_delta)
+                                VALUES({guild_id}, :user, :character, :session, :in_timestamp, :out_timestamp, :_DEBUG_user_name, :_DEBUG_in, :_DEBUG_out, :_DEBUG_delta)"""
+    async def job(db):
+        for rowid in delete_rowids:
+            await db.execute(f"DELETE FROM historical WHERE server = {guild_id} AND rowid = {int(rowid)}")
+        rows = []
+        for record in records:
+            async with db.execute(query, record) as cursor:
+                rows.append(cursor.lastrowid)
+        return rows
+    rows = await submit_write(job)
+    if delete_rowids or records:
+        _historical_changed(guild_id)
+    return rows
     
     # ==============================================================================
     # Commands (commands table)
     # ============================================================================== 
 
+async def _store_commands(entries):
+    query = f"""INSERT INTO commands(server,  command_name,  options,  datetime,  user,  user_name,  channel_name)
+                              VALUES(:server, :command_name, :options, :datetime, :user, :user_name, :channel_name)"""
+    writer = _writer or await get_writer()
+    return await writer.executemany(query, entries)
+
+_command_log = CommandLog(_store_commands)
+
+# Buffered, the row is written by the next command log flush
 async def store_command(guild_id, command):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        query = f"""INSERT INTO commands(server,      command_name,  options,  datetime,  user,  user_name,  channel_name)
-                                  VALUES({guild_id}, :command_name, :options, :datetime, :user, :user_name, :channel_name)"""
-        async with db.execute(query, command) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+    _command_log.append(dict(command, server=guild_id))
+
+async def flush_commands() -> int:
+    return await _command_log.flush()
+
+def get_command_log_depth() -> int:
+    return _command_log.depth
     
 async def get_commands_history(guild_id):
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    await flush_commands()
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM commands WHERE server = {guild_id}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -278,8 +403,8 @@ async def get_commands_history(guild_id):
 
 async def get_last_rows_commands_history(guild_id, count) -> list[dict]:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    await flush_commands()
+    async with connect() as db:
         query = f"""SELECT rowid, * FROM commands WHERE server = {guild_id} ORDER BY rowid DESC LIMIT {count}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -288,16 +413,24 @@ async def get_last_rows_commands_history(guild_id, count) -> list[dict]:
 
 async def get_user_commands_history(guild_id, user_id, start_at=None, count=10) -> list[dict]:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
-        if start_at:
-            count += start_at
-        query = f"""SELECT rowid, * FROM commands WHERE server = {guild_id} and user = {user_id} ORDER BY rowid DESC LIMIT {count}"""
+    await flush_commands()
+    async with connect() as db:
+        query = f"""SELECT rowid, * FROM commands WHERE server = {guild_id} and user = {user_id} ORDER BY rowid DESC LIMIT {int(count)} OFFSET {int(start_at or 0)}"""
+        async with db.execute(query) as cursor:
+            rows = await cursor.fetchall()
+            res = [dict(row) for row in rows]
+    return res
+
+# Keyset page of a user's commands, newest first, starting after (older than) before_rowid
+async def get_user_commands_page(guild_id, user_id, before_rowid=None, count=10) -> list[dict]:
+    res = []
+    await flush_commands()
+    keyset = f"AND rowid < {int(before_rowid)}" if before_rowid is not None else ''
+    async with connect() as db:
+        query = f"""SELECT rowid, * FROM commands WHERE server = {guild_id} AND user = {user_id} {keyset} ORDER BY rowid DESC LIMIT {int(count)}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
             res = [dict(row) for row in rows]
-        if start_at:
-            res = res[start_at:]
     return res
     # ==============================================================================
     # Tod
@@ -305,25 +438,30 @@ async def get_user_commands_history(guild_id, user_id, start_at=None, count=10)
 
 async def get_tod(guild_id, mob_name="Drusella Sathir") -> dict:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
-        query = f"SELECT rowid, * FROM tod WHERE server = {guild_id} ORDER BY submitted_timestamp DESC LIMIT 1"
-        async with db.execute(query) as cursor:
+    async with connect() as db:
+        query = f"SELECT rowid, * FROM tod WHERE server = {guild_id} AND mob = ? ORDER BY submitted_timestamp DESC LIMIT 1"
+        async with db.execute(query, (mob_name,)) as cursor:
             row = await cursor.fetchone()
             if not row:
                 return None
             res = dict(row)
     return res
+
+# Latest submitted ToD of every mob, served by idx_tod_server_mob_submitted
+async def get_latest_tods(guild_id) -> list[dict]:
+    res = []
+    async with connect() as db:
+        query = f"""SELECT t.rowid, t.* FROM tod t
+                    WHERE t.server = {guild_id} AND t.rowid = (SELECT rowid FROM tod WHERE server = t.server AND mob = t.mob ORDER BY submitted_timestamp DESC LIMIT 1)"""
+        async with db.execute(query) as cursor:
+            rows = await cursor.fetchall()
+            res = [dict(row) for row in rows]
+    return res
     
 async def store_tod(guild_id, info):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        query = f"""INSERT INTO tod(server,       mob,  tod_timestamp,  submitted_timestamp,  submitted_by_id,  _DEBUG_submitted_datetime,  _DEBUG_submitted_by,  _DEBUG_tod_datetime)
-                             VALUES({guild_id}, :mob, :tod_timestamp, :submitted_timestamp, :submitted_by_id, :_DEBUG_submitted_datetime, :_DEBUG_submitted_by, :_DEBUG_tod_datetime)"""
-        async with db.execute(query, info) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+    query = f"""INSERT INTO tod(server,       mob,  tod_timestamp,  submitted_timestamp,  submitted_by_id,  _DEBUG_submitted_datetime,  _DEBUG_submitted_by,  _DEBUG_tod_datetime)
+                         VALUES({guild_id}, :mob, :tod_timestamp, :submitted_timestamp, :submitted_by_id, :_DEBUG_submitted_datetime, :_DEBUG_submitted_by, :_DEBUG_tod_datetime)"""
+    return await execute_write(query, info)
     
     # ==============================================================================
     # Replacement Queue
@@ -331,8 +469,7 @@ async def store_tod(guild_id, info):
 
 async def get_replacement_queue(guild_id) -> list:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"SELECT rowid, * FROM reps WHERE server = {guild_id} ORDER BY in_timestamp ASC"
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -340,23 +477,15 @@ async def get_replacement_queue(guild_id) -> list:
     return res
 
 async def add_replacement(guild_id, replacement):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        try:
-            query = f"""INSERT INTO reps(server, user, name, in_timestamp)
-                                    VALUES({guild_id}, :user, :name, :in_timestamp)"""
-            async with db.execute(query, replacement) as cursor:
-                lastrow = cursor.lastrowid
-        except aiosqlite.IntegrityError:
-            return None
-        else:
-            await db.commit()
-    return lastrow
+    try:
+        query = f"""INSERT INTO reps(server, user, name, in_timestamp)
+                                VALUES({guild_id}, :user, :name, :in_timestamp)"""
+        return await execute_write(query, replacement)
+    except aiosqlite.IntegrityError:
+        return None
 
 async def remove_replacement(guild_id, user_id):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async def job(db):
         query = f"""SELECT count(*) FROM reps WHERE server = {guild_id} AND user = {user_id}"""
         async with db.execute(query) as cursor:
             res = await cursor.fetchall()
@@ -364,9 +493,8 @@ async def remove_replacement(guild_id, user_id):
                 return None
         query = f"""DELETE FROM reps WHERE server = {guild_id} AND user = {user_id}"""
         async with db.execute(query) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+            return cursor.lastrowid
+    return await submit_write(job)
     
 async def remove_replacements(guild_id, users=[]):
     res = []
@@ -376,19 +504,12 @@ async def remove_replacements(guild_id, users=[]):
     return res
 
 async def clear_replacement_queue(guild_id):
-    lastrow = 0
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
-        query = f"""DELETE FROM reps WHERE server = {guild_id}"""
-        async with db.execute(query) as cursor:
-            lastrow = cursor.lastrowid
-        await db.commit()
-    return lastrow
+    query = f"""DELETE FROM reps WHERE server = {guild_id}"""
+    return await execute_write(query)
 
 async def get_replacement(guild_id, user_id):
     res = {}
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f'''SELECT * FROM reps WHERE "server" = {guild_id} AND "user" = {user_id}'''
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -404,8 +525,7 @@ async def get_replacements_before_user(guild_id, user_id) -> list:
         rep = {'in_timestamp': get_current_timestamp()}
     
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with connect() as db:
         query = f"""SELECT * FROM reps WHERE "server" = {guild_id} AND "in_timestamp" < {rep['in_timestamp']}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
@@ -416,53 +536,104 @@ async def get_replacements_before_user(guild_id, user_id) -> list:
     # Misc
     # ============================================================================== 
     
-# Returns list of int of unique users stored in historical for a given guild
-async def get_unique_users(guild_id) -> list[int]:
+async def get_user_seconds(guild_id, user):
+    async with connect() as db:
+        query = f"SELECT seconds FROM user_totals WHERE server = {guild_id} AND user = {int(user)}"
+        async with db.execute(query) as cursor:
+            row = await cursor.fetchone()
+    if not row:
+        return 0
+    return int(row['seconds'])
+
+# Ranked [{'user': int, 'total': hours}] read from user_totals, only the top `limit` rows are returned
+async def get_leaderboard(guild_id, limit=None) -> list[dict]:
     res = []
-    async with aiosqlite.connect('data/urnby.db') as db:
-        db.row_factory = aiosqlite.Row
-        query = f"SELECT DISTINCT user FROM historical WHERE server = {guild_id}"
+    async with connect() as db:
+        query = f"""SELECT user, seconds AS total FROM user_totals WHERE server = {guild_id}
+                    ORDER BY seconds DESC LIMIT {int(limit) if limit else -1}"""
         async with db.execute(query) as cursor:
             rows = await cursor.fetchall()
-            res = [row['user'] for row in rows]
+            res = [{'user': row['user'], 'total': get_hours_from_secs(row['total'])} for row in rows]
     return res
 
-async def get_user_seconds(guild_id, user, guild_historical=None):
-    
-    if not guild_historical:
-        guild_historical = await get_historical(guild_id)
-    
-    if not guild_historical:
-        return None
-        
-    found = [_ for _ in guild_historical if _['user'] == int(user)]
-    
-    if len(found) == 0:
-        return 0
-    
-    in_tot = 0
-    out_tot = 0
-    for item in found:
-        in_tot += item['in_timestamp']
-        out_tot += item['out_timestamp']
-    return out_tot - in_tot
-
-async def get_user_hours(guild_id, user, guild_historical=None, limit=None) -> float:
-    secs = await get_user_seconds(guild_id, user, guild_historical)
-    
-    return get_hours_from_secs(secs)
+# Recomputes user_totals from historical, for every guild when guild_id is None
+async def rebuild_user_totals(guild_id=None) -> int:
+    guild_filter = f"WHERE server = {guild_id}" if guild_id is not None else ''
+    async def job(db):
+        await db.execute(f"DELETE FROM user_totals {guild_filter}")
+        query = f"""INSERT INTO user_totals(server, user, seconds, record_count)
+                    SELECT server, user, TOTAL(out_timestamp - in_timestamp), COUNT(*) FROM historical {guild_filter} GROUP BY server, user"""
+        async with db.execute(query) as cursor:
+            return cursor.rowcount
+    count = await submit_write(job)
+    _historical_changed(guild_id)
+    return count
 
-# Wraps get_users_hours but only needs one grab from historical json
-async def get_users_hours(guild_id, users, limit=None) -> list[dict]:
-    guild_historical = await get_historical(guild_id)
+# Returns the users whose stored totals disagree with a full scan of historical
+async def verify_user_totals(guild_id) -> list[dict]:
     res = []
-    if not guild_historical:
-        return res
-    
-    for user in users:
-        tot = await get_user_hours(guild_id, user, guild_historical, limit=limit)
-        res.append({'user': user, 'total':tot})
-    sorted_res = list(sorted(res, key= lambda user: user['total'], reverse=True))
-    if limit:
-        sorted_res = sorted_res[:limit]
-    return sorted_res
\ No newline at end of file
+    async with connect() as db:
+        query = f"""SELECT h.user AS user, h.seconds AS expected, h.record_count AS expected_count, t.seconds AS stored, t.record_count AS stored_count
+                    FROM (SELECT user, TOTAL(out_timestamp - in_timestamp) AS seconds, COUNT(*) AS record_count FROM historical WHERE server = {guild_id} GROUP BY user) AS h
+                    LEFT JOIN user_totals AS t ON t.server = {guild_id} AND t.user = h.user
+                    WHERE t.user IS NULL OR t.record_count != h.record_count OR ABS(t.seconds - h.seconds) > 0.5
+                    UNION ALL
+                    SELECT t.user, 0, 0, t.seconds, t.record_count FROM user_totals AS t
+                    WHERE t.server = {guild_id} AND NOT EXISTS (SELECT 1 FROM historical WHERE server = {guild_id} AND user = t.user)"""
+        async with db.execute(query) as cursor:
+            rows = await cursor.fetchall()
+            res = [dict(row) for row in rows]
+    return res
+
+    # ==============================================================================
+    # Dashboard
+    # ==============================================================================
+
+# kind -> {'channel_id', 'message_id'} of the dashboard messages last posted in the guild
+async def get_dashboard_messages(guild_id) -> dict:
+    async with connect() as db:
+        query = f"SELECT kind, channel_id, message_id FROM dashboard_messages WHERE server = {guild_id}"
+        async with db.execute(query) as cursor:
+            rows = await cursor.fetchall()
+    return {row['kind']: {'channel_id': row['channel_id'], 'message_id': row['message_id']} for row in rows}
+
+async def set_dashboard_message(guild_id, kind, channel_id, message_id):
+    query = f"""INSERT INTO dashboard_messages(server, kind, channel_id, message_id) VALUES({guild_id}, ?, ?, ?)
+                ON CONFLICT(server, kind) DO UPDATE SET channel_id = excluded.channel_id, message_id = excluded.message_id"""
+    return await execute_write(query, (kind, channel_id, message_id))
+
+@dataclass
+class DashboardSnapshot:
+    session: dict | None
+    actives: list[dict]
+    # user -> hours already banked in the current session, PCT_BONUS records excluded
+    session_hours: dict[int, float]
+    reps: list[dict]
+
+# Everything one dashboard render reads besides the leaderboard and spawn timers, taken in a single read transaction so the board is consistent
+async def get_dashboard_snapshot(guild_id) -> DashboardSnapshot:
+    async with connect() as db:
+        await db.execute("BEGIN")
+        try:
+            async with db.execute(f"SELECT rowid, * FROM session WHERE server = {guild_id}") as cursor:
+                rows = await cursor.fetchall()
+            if len(rows) > 1:
+                raise ValueError(f'Error, server {guild_id} has more then one active session {len(rows)}')
+            session = dict(rows[0]) if rows else None
+            
+            async with db.execute(f"SELECT rowid, * FROM active WHERE server = {guild_id}") as cursor:
+                actives = [dict(row) for row in await cursor.fetchall()]
+            
+            session_hours = {}
+            if session:
+                # Rounded and floored per record like get_hours_from_secs, so urn records never count
+                query = f"""SELECT user, TOTAL(MAX(ROUND((out_timestamp - in_timestamp) / 3600.0, 2), 0)) AS hours FROM historical
+                            WHERE server = {guild_id} AND session = ? AND instr(character, 'PCT_BONUS') = 0 GROUP BY user"""
+                async with db.execute(query, (session['session'],)) as cursor:
+                    session_hours = {row['user']: row['hours'] for row in await cursor.fetchall()}
+            
+            async with db.execute(f"SELECT rowid, * FROM reps WHERE server = {guild_id} ORDER BY in_timestamp ASC") as cursor:
+                reps = [dict(row) for row in await cursor.fetchall()]
+        finally:
+            await db.commit()
+    return DashboardSnapshot(session, actives, session_hours, reps)
@@ -0,0 +1,98 @@
+import io
+import csv
+import gzip
+import json
+import tempfile
+from contextlib import asynccontextmanager
+
+import aiosqlite
+import data.databaseapi as db
+import data.backup as backup
+
+BATCH_SIZE = 500
+# Exports larger than this spill from memory to a temp file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+FORMATS = ['ndjson', 'csv']
+
+# datatype option -> table, time column and user column used by the filters
+# commands only stores an iso datetime string, which compares correctly as text
+EXPORT_TABLES = {
+    'historical': ('historical', 'in_timestamp', 'user'),
+    'actives': ('active', 'in_timestamp', 'user'),
+    'session': ('session', 'start_timestamp', 'created_by'),
+    'historicalsession': ('session_history', 'start_timestamp', 'created_by'),
+    'commands': ('commands', 'datetime', 'user'),
+}
+
+def _time_value(table, value):
+    if table == 'commands':
+        return f"'{value.isoformat()}'"
+    return int(value.timestamp())
+
+# Opens the snapshot read only so exports never compete with the live database, or a pooled connection when snapshot is None
+@asynccontextmanager
+async def _source(snapshot):
+    if snapshot is None:
+        async with db.connect() as conn:
+            yield conn
+        return
+    async with aiosqlite.connect(f'file:{snapshot}?mode=ro', uri=True) as conn:
+        conn.row_factory = aiosqlite.Row
+        yield conn
+
+# Yields batches of row dicts from a single SELECT, which sqlite serves from one consistent snapshot
+async def iter_rows(guild_id, data_type, start_datetime=None, end_datetime=None, user_id=None, batch_size=BATCH_SIZE, snapshot=None):
+    table, time_column, user_column = EXPORT_TABLES[data_type]
+    filters = [f"server = {int(guild_id)}"]
+    if user_id is not None:
+        filters.append(f"{user_column} = {int(user_id)}")
+    if start_datetime is not None:
+        filters.append(f"{time_column} >= {_time_value(table, start_datetime)}")
+    if end_datetime is not None:
+        filters.append(f"{time_column} < {_time_value(table, end_datetime)}")
+    if table == 'commands' and snapshot is None:
+        await db.flush_commands()
+    query = f"SELECT rowid, * FROM {table} WHERE {' AND '.join(filters)} ORDER BY rowid ASC"
+    async with _source(snapshot) as conn:
+        async with conn.execute(query) as cursor:
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+
+# Returns (file object positioned at 0, filename, row count, snapshot timestamp or None when read live). Caller closes the file object
+# Reads the latest backup snapshot unless live is set or no snapshot exists yet
+async def export_table(guild_id, data_type, fmt='ndjson', compress=False, start_datetime=None, end_datetime=None, user_id=None, live=False):
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format {fmt}')
+    snapshot = None if live else backup.latest_snapshot()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    sink = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+    fieldnames = None
+    count = 0
+    try:
+        async for rows in iter_rows(guild_id, data_type, start_datetime, end_datetime, user_id, snapshot=snapshot):
+            # Encode one batch at a time so only a batch is ever held as text
+            text = io.StringIO()
+            if fmt == 'csv':
+                writer = csv.DictWriter(text, fieldnames=fieldnames or list(rows[0].keys()), extrasaction='ignore')
+                if fieldnames is None:
+                    fieldnames = writer.fieldnames
+                    writer.writeheader()
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    text.write(json.dumps(row) + '\n')
+            sink.write(text.getvalue().encode('utf-8'))
+            count += len(rows)
+        if compress:
+            sink.close()
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    filename = f'{data_type}.{fmt}' + ('.gz' if compress else '')
+    snapshot_timestamp = backup.snapshot_timestamp(snapshot) if snapshot else None
+    return spool, filename, count, snapshot_timestamp
@@ -0,0 +1,54 @@
+import asyncio
+
+import data.databaseapi as db
+
+# guild_id -> full ranking [{'user', 'total'(hours)}] highest first, and user -> index into it
+_boards = {}
+_ranks = {}
+# Bumped on every invalidation so a rebuild that raced a write is not cached
+_generation = {}
+_locks = {}
+
+def invalidate(guild_id=None):
+    if guild_id is None:
+        for _guild_id in list(_boards):
+            invalidate(_guild_id)
+        return
+    _generation[guild_id] = _generation.get(guild_id, 0) + 1
+    _boards.pop(guild_id, None)
+    _ranks.pop(guild_id, None)
+
+db.on_historical_change(invalidate)
+
+async def _get_board(guild_id) -> list[dict]:
+    board = _boards.get(guild_id)
+    if board is not None:
+        return board
+    async with _locks.setdefault(guild_id, asyncio.Lock()):
+        board = _boards.get(guild_id)
+        if board is not None:
+            return board
+        generation = _generation.get(guild_id, 0)
+        board = await db.get_leaderboard(guild_id)
+        if generation == _generation.get(guild_id, 0):
+            _boards[guild_id] = board
+            _ranks[guild_id] = {item['user']: idx for idx, item in enumerate(board)}
+    return board
+
+# Copies, callers are free to add keys like display_name
+async def get_top(guild_id, k=None) -> list[dict]:
+    board = await _get_board(guild_id)
+    if k is not None:
+        board = board[:k]
+    return [dict(item) for item in board]
+
+# Returns (rank starting at 1, total hours) or None if the user has no time
+async def get_rank(guild_id, user_id):
+    board = await _get_board(guild_id)
+    ranks = _ranks.get(guild_id)
+    if ranks is None:
+        ranks = {item['user']: idx for idx, item in enumerate(board)}
+    idx = ranks.get(int(user_id))
+    if idx is None:
+        return None
+    return idx + 1, board[idx]['total']
@@ -0,0 +1,120 @@
+import os
+import json
+
+import aiosqlite
+from static.common import get_current_timestamp, get_current_iso
+
+LEGACY_CONFIG_PATH = os.getenv('CONFIG_PATH', 'data/config.json')
+
+# One time import of the json config, lists of plain values become guild_config_items rows and anything else a json value
+async def _import_config_json(db):
+    if not os.path.exists(LEGACY_CONFIG_PATH):
+        return
+    with open(LEGACY_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    values = []
+    items = []
+    for guild_id, guild_config in config.items():
+        for key, value in guild_config.items():
+            if isinstance(value, list) and not any(isinstance(v, (dict, list)) for v in value):
+                items += [(int(guild_id), key, v) for v in value]
+            elif value != "":
+                values.append((int(guild_id), key, json.dumps(value)))
+    await db.executemany("""INSERT OR REPLACE INTO guild_config(server, key, value) VALUES(?, ?, ?)""", values)
+    await db.executemany("""INSERT OR IGNORE INTO guild_config_items(server, key, value) VALUES(?, ?, ?)""", items)
+    print(f"{get_current_iso()} - Imported {len(values)} config values and {len(items)} config list items from {LEGACY_CONFIG_PATH}", flush=True)
+
+# Append only, never edit a migration that has shipped. Each entry is applied once in its own transaction
+# and recorded in schema_version. A step is either a SQL string or an async callable taking the connection.
+MIGRATIONS = [
+    (1, 'Base tables', [
+        """CREATE TABLE IF NOT EXISTS "historical"(server, user, character, session, in_timestamp, out_timestamp, _DEBUG_user_name, _DEBUG_in, _DEBUG_out, _DEBUG_delta);""",
+        """CREATE TABLE IF NOT EXISTS "session"(server, session, created_by, _DEBUG_started_by, _DEBUG_start, start_timestamp, ended_by, _DEBUG_ended_by, _DEBUG_end, end_timestamp, _DEBUG_delta);""",
+        """CREATE TABLE IF NOT EXISTS "session_history"(server, session, created_by, _DEBUG_started_by, _DEBUG_start, start_timestamp, ended_by, _DEBUG_ended_by, _DEBUG_end, end_timestamp,      _DEBUG_delta);""",
+        """CREATE TABLE IF NOT EXISTS "active"(server, user, character, session, in_timestamp, out_timestamp, _DEBUG_user_name, _DEBUG_in, _DEBUG_out, _DEBUG_delta);""",
+        """CREATE TABLE IF NOT EXISTS "commands"(server, command_name, options, datetime, user, user_name, channel_name);""",
+        """CREATE TABLE IF NOT EXISTS "tod"(server, mob, tod_timestamp, submitted_timestamp, submitted_by_id, _DEBUG_submitted_datetime, _DEBUG_submitted_by, _DEBUG_tod_datetime);""",
+        """CREATE TABLE IF NOT EXISTS "reps"(server, user, name, in_timestamp, UNIQUE(server, user));""",
+    ]),
+    (2, 'Indexes on hot lookup columns', [
+        """CREATE INDEX IF NOT EXISTS "idx_historical_server_user" ON historical(server, user);""",
+        """CREATE INDEX IF NOT EXISTS "idx_historical_server_session" ON historical(server, session);""",
+        """CREATE INDEX IF NOT EXISTS "idx_active_server_user" ON active(server, user);""",
+        """CREATE INDEX IF NOT EXISTS "idx_session_server" ON session(server);""",
+        """CREATE INDEX IF NOT EXISTS "idx_session_history_server_session" ON session_history(server, session);""",
+        # rowid is implicitly the last column of every index, so this also serves ORDER BY rowid
+        """CREATE INDEX IF NOT EXISTS "idx_commands_server_user" ON commands(server, user);""",
+        """CREATE INDEX IF NOT EXISTS "idx_tod_server_mob_submitted" ON tod(server, mob, submitted_timestamp);""",
+        """CREATE INDEX IF NOT EXISTS "idx_tod_server_submitted" ON tod(server, submitted_timestamp);""",
+        """CREATE INDEX IF NOT EXISTS "idx_reps_server_in_timestamp" ON reps(server, in_timestamp);""",
+        """ANALYZE;""",
+    ]),
+    (3, 'Incrementally maintained per-user totals', [
+        """CREATE TABLE IF NOT EXISTS "user_totals"(server, user, seconds NOT NULL DEFAULT 0, record_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY(server, user));""",
+        """CREATE INDEX IF NOT EXISTS "idx_user_totals_server_seconds" ON user_totals(server, seconds);""",
+        # Triggers keep user_totals in the same transaction as the historical write that changed it
+        """CREATE TRIGGER IF NOT EXISTS "trg_historical_insert_totals" AFTER INSERT ON historical BEGIN
+               INSERT INTO user_totals(server, user, seconds, record_count) VALUES(NEW.server, NEW.user, NEW.out_timestamp - NEW.in_timestamp, 1)
+               ON CONFLICT(server, user) DO UPDATE SET seconds = seconds + excluded.seconds, record_count = record_count + 1;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS "trg_historical_delete_totals" AFTER DELETE ON historical BEGIN
+               UPDATE user_totals SET seconds = seconds - (OLD.out_timestamp - OLD.in_timestamp), record_count = record_count - 1 WHERE server = OLD.server AND user = OLD.user;
+               DELETE FROM user_totals WHERE server = OLD.server AND user = OLD.user AND record_count <= 0;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS "trg_historical_update_totals" AFTER UPDATE OF server, user, in_timestamp, out_timestamp ON historical BEGIN
+               UPDATE user_totals SET seconds = seconds - (OLD.out_timestamp - OLD.in_timestamp), record_count = record_count - 1 WHERE server = OLD.server AND user = OLD.user;
+               DELETE FROM user_totals WHERE server = OLD.server AND user = OLD.user AND record_count <= 0;
+               INSERT INTO user_totals(server, user, seconds, record_count) VALUES(NEW.server, NEW.user, NEW.out_timestamp - NEW.in_timestamp, 1)
+               ON CONFLICT(server, user) DO UPDATE SET seconds = seconds + excluded.seconds, record_count = record_count + 1;
+           END;""",
+        """DELETE FROM user_totals;""",
+        """INSERT INTO user_totals(server, user, seconds, record_count)
+               SELECT server, user, TOTAL(out_timestamp - in_timestamp), COUNT(*) FROM historical GROUP BY server, user;""",
+    ]),
+    (4, 'Guild config tables imported from config.json', [
+        """CREATE TABLE IF NOT EXISTS "guild_config"(server INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY(server, key));""",
+        # List values like member_roles get a row per item so adding one is a single insert
+        """CREATE TABLE IF NOT EXISTS "guild_config_items"(server INTEGER NOT NULL, key TEXT NOT NULL, value NOT NULL, UNIQUE(server, key, value));""",
+        _import_config_json,
+    ]),
+    (5, 'Persisted dashboard message ids', [
+        """CREATE TABLE IF NOT EXISTS "dashboard_messages"(server INTEGER NOT NULL, kind TEXT NOT NULL, channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, PRIMARY KEY(server, kind));""",
+    ]),
+    (6, 'One active record per user', [
+        # Racing clockins could store a user twice, keep the first
+        """DELETE FROM active WHERE rowid NOT IN (SELECT MIN(rowid) FROM active GROUP BY server, user);""",
+        """DROP INDEX IF EXISTS "idx_active_server_user";""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS "uq_active_server_user" ON active(server, user);""",
+    ]),
+]
+
+async def get_schema_version(db) -> int:
+    query = """CREATE TABLE IF NOT EXISTS "schema_version"(version INTEGER PRIMARY KEY, description, applied_timestamp, _DEBUG_applied);"""
+    await db.execute(query)
+    await db.commit()
+    async with db.execute("""SELECT MAX(version) FROM schema_version""") as cursor:
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+async def run_migrations(db) -> int:
+    current = await get_schema_version(db)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"{get_current_iso()} - Applying database migration {version}: {description}", flush=True)
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            query = """INSERT INTO schema_version(version, description, applied_timestamp, _DEBUG_applied) VALUES(?, ?, ?, ?)"""
+            await db.execute(query, (version, description, get_current_timestamp(), get_current_iso()))
+            await db.commit()
+        except aiosqlite.Error as err:
+            await db.rollback()
+            print(f"{get_current_iso()} - Database migration {version} failed and was rolled back: {err}", flush=True)
+            raise
+        current = version
+    return current
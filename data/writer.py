@@ -0,0 +1,142 @@
+import asyncio
+
+import aiosqlite
+
+# Jobs that arrive within BATCH_WINDOW seconds of the first one share a transaction
+BATCH_WINDOW = 0.005
+MAX_BATCH = 200
+
+class WriterClosed(Exception):
+    pass
+
+# Owns the only connection that writes to the database. Callers submit jobs, an async callable taking
+# the connection, and get back a future with the job's return value. Each job runs inside its own
+# SAVEPOINT so one failing job is rolled back and reported without aborting the rest of its batch.
+class DatabaseWriter:
+    def __init__(self, path, pragmas=None, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.path = path
+        self.pragmas = pragmas or []
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._conn = None
+        self._task = None
+        self._closed = False
+        self.batches = 0
+        self.jobs = 0
+
+    async def start(self):
+        # Autocommit mode, transactions are opened and closed explicitly per batch
+        self._conn = await aiosqlite.connect(self.path, isolation_level=None)
+        self._conn.row_factory = aiosqlite.Row
+        for pragma in self.pragmas:
+            await self._conn.execute(pragma)
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def submit(self, fn) -> asyncio.Future:
+        if self._closed:
+            raise WriterClosed(f'Database writer for {self.path} is closed')
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((fn, future))
+        return future
+
+    async def execute(self, query, params=()) -> int:
+        async def job(db):
+            async with db.execute(query, params) as cursor:
+                return cursor.lastrowid
+        return await self.submit(job)
+
+    async def executemany(self, query, params) -> int:
+        async def job(db):
+            async with db.executemany(query, params) as cursor:
+                return cursor.rowcount
+        return await self.submit(job)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    job = self._queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        job = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                await self._commit_batch(batch)
+            except Exception as err:
+                # Never let one batch take the writer down, later submits would wait forever
+                print(f"Database writer failed handling a batch of {len(batch)} jobs: {err}", flush=True)
+                self._fail(batch, err)
+
+    def _fail(self, batch, err):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(err)
+
+    async def _commit_batch(self, batch):
+        results = []
+        try:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                if future.cancelled():
+                    continue
+                await self._conn.execute("SAVEPOINT job")
+                try:
+                    res = await fn(self._conn)
+                except Exception as err:
+                    await self._conn.execute("ROLLBACK TO job")
+                    await self._conn.execute("RELEASE job")
+                    results.append((future, None, err))
+                else:
+                    await self._conn.execute("RELEASE job")
+                    results.append((future, res, None))
+            await self._conn.execute("COMMIT")
+        except Exception as err:
+            print(f"Database writer failed committing a batch of {len(batch)} jobs: {err}", flush=True)
+            try:
+                if self._conn.in_transaction:
+                    await self._conn.execute("ROLLBACK")
+            except Exception as rollback_err:
+                print(f"Database writer failed rolling back the batch: {rollback_err}", flush=True)
+            self._fail(batch, err)
+            return
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, res, err in results:
+            if future.done():
+                continue
+            if err is not None:
+                future.set_exception(err)
+            else:
+                future.set_result(res)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Sentinel goes behind anything already queued so pending writes are committed first
+        self._queue.put_nowait(None)
+        if self._task:
+            await self._task
+        if self._conn:
+            await self._conn.close()
@@ -0,0 +1,135 @@
+import bisect
+import datetime
+from collections import Counter
+from zoneinfo import ZoneInfo
+
+import data.configapi as configapi
+import static.common as com
+
+# Local dates of materialized windows kept per guild, a history recompute walks many so the cache resets past this
+MAX_CACHED_DAYS = 400
+
+_tz = ZoneInfo(com.tz_str)
+# guild_id -> [(config index, bonus, start time, end time)] parsed once from bonus_hours
+_compiled = {}
+# guild_id -> {local date: (windows sorted by start, their start timestamps, longest window in seconds)}
+_days = {}
+
+def invalidate(guild_id=None, key=None):
+    if key is not None and key != 'bonus_hours':
+        return
+    if guild_id is None:
+        _compiled.clear()
+        _days.clear()
+        return
+    _compiled.pop(guild_id, None)
+    _days.pop(guild_id, None)
+
+configapi.subscribe(invalidate)
+
+def _compile(guild_id) -> list:
+    compiled = _compiled.get(guild_id)
+    if compiled is None:
+        config = configapi.get_guild_config(guild_id) or {}
+        compiled = [(idx, bonus, datetime.time.fromisoformat(bonus['start']), datetime.time.fromisoformat(bonus['end']))
+                    for idx, bonus in enumerate(config.get('bonus_hours') or [])]
+        _compiled[guild_id] = compiled
+    return compiled
+
+# Bonus windows are wall clock times, so each local date gets its own timestamps and DST days come out an hour shorter or longer
+def _windows(guild_id, date) -> tuple:
+    days = _days.setdefault(guild_id, {})
+    cached = days.get(date)
+    if cached:
+        return cached
+    if len(days) >= MAX_CACHED_DAYS:
+        days.clear()
+    windows = []
+    for idx, bonus, start, end in _compile(guild_id):
+        bonus_in = datetime.datetime.combine(date, start, tzinfo=_tz)
+        bonus_out = datetime.datetime.combine(date, end, tzinfo=_tz)
+        windows.append((bonus_in.timestamp(), bonus_out.timestamp(), idx, bonus, bonus_in, bonus_out))
+    windows.sort(key=lambda window: window[0])
+    starts = [window[0] for window in windows]
+    longest = max([window[1] - window[0] for window in windows] + [0])
+    days[date] = (windows, starts, longest)
+    return days[date]
+
+# Windows of one date touching [in_ts, out_ts], ends included. Any window ending after in_ts starts after in_ts - longest
+def _overlaps(guild_id, date, in_ts, out_ts) -> list:
+    windows, starts, longest = _windows(guild_id, date)
+    lo = bisect.bisect_left(starts, in_ts - longest)
+    hi = bisect.bisect_right(starts, out_ts)
+    return [window for window in windows[lo:hi] if in_ts <= window[1]]
+
+# Bonus records earned by a historical record stored as row, in config order then by day
+def evaluate(guild_id, record, row, log=True) -> list[dict]:
+    if not _compile(guild_id):
+        return []
+    _in = com.datetime_from_timestamp(record['in_timestamp'])
+    _out = com.datetime_from_timestamp(record['out_timestamp'])
+    in_ts = _in.timestamp()
+    out_ts = _out.timestamp()
+    found = []
+    for day in range((_out.date() - _in.date()).days+1):
+        found += _overlaps(guild_id, _in.date()+datetime.timedelta(days=day), in_ts, out_ts)
+    found.sort(key=lambda window: window[2])
+    
+    bonuses = []
+    for bonus_in_ts, bonus_out_ts, idx, bonus, bonus_in, bonus_out in found:
+        if log:
+            print(f'{com.get_current_iso()} [{guild_id}] - Bonus hours found for {record["_DEBUG_user_name"]}', flush=True)
+        duration = int(min(out_ts - in_ts, out_ts - bonus_in_ts, bonus_out_ts - in_ts, bonus_out_ts - bonus_in_ts))
+        duration = int(duration * (float(bonus['pct'])/100))
+        start = _in if _in > bonus_in else bonus_in
+        rec = dict(record)
+        rec['character'] = f'{bonus["pct"]}_PCT_BONUS_{bonus["start"]}_TO_{bonus["end"]} {row}'
+        rec['in_timestamp'] = int(start.timestamp())
+        rec['out_timestamp'] = int(start.timestamp()+duration)
+        rec['_DEBUG_in'] = start.isoformat()
+        rec['_DEBUG_out'] = (start + datetime.timedelta(seconds=duration)).isoformat()
+        rec['_DEBUG_delta'] = com.get_hours_from_secs(duration)
+        bonuses.append(rec)
+    return bonuses
+
+# records is [(record, row)], bonuses come back in the same record order
+def evaluate_many(guild_id, records, log=True) -> list[dict]:
+    if not _compile(guild_id):
+        return []
+    bonuses = []
+    for record, row in records:
+        bonuses += evaluate(guild_id, record, row, log)
+    return bonuses
+
+def _key(record) -> tuple:
+    return (record['user'], record['character'], int(record['in_timestamp']), int(record['out_timestamp']))
+
+# Compares the stored percentage bonus rows of a guild's history against what the current bonus_hours would give.
+# Returns (missing bonus records to store, stored bonus records that no longer apply)
+def plan_recompute(guild_id, historical) -> tuple[list[dict], list[dict]]:
+    stored = []
+    base = []
+    for record in historical:
+        character = str(record['character'])
+        if '_PCT_BONUS_' in character:
+            stored.append(record)
+        elif '_BONUS' not in character and not character.startswith('URN_ZERO_OUT_EVENT'):
+            base.append((record, record['rowid']))
+    expected = evaluate_many(guild_id, base, log=False)
+    
+    expected_keys = Counter(_key(record) for record in expected)
+    stale = []
+    for record in stored:
+        if expected_keys[_key(record)] > 0:
+            expected_keys[_key(record)] -= 1
+        else:
+            stale.append(record)
+    stored_keys = Counter(_key(record) for record in stored)
+    missing = []
+    for record in expected:
+        if stored_keys[_key(record)] > 0:
+            stored_keys[_key(record)] -= 1
+        else:
+            record.pop('rowid', None)
+            missing.append(record)
+    return missing, stale
@@ -0,0 +1,29 @@
+import discord
+from static.ttlcache import TTLCache
+
+# Channels fetched over REST are not kept current by the gateway, so they expire and are dropped on update/delete events
+CHANNEL_CACHE_TTL = 600
+MISSING_CHANNEL_TTL = 60
+
+_cache = TTLCache(CHANNEL_CACHE_TTL, MISSING_CHANNEL_TTL)
+
+def invalidate(guild_id, channel_id=None):
+    _cache.invalidate(guild_id, channel_id)
+
+# Resolves a channel from the gateway cache, then our TTL cache and only then REST. Returns None when it is gone or hidden from us
+async def get_channel(guild: discord.Guild, channel_id):
+    if not channel_id:
+        return None
+    channel_id = int(channel_id)
+    channel = guild.get_channel(channel_id)
+    if channel:
+        return channel
+    found, channel = _cache.get(guild.id, channel_id)
+    if found:
+        return channel
+    try:
+        channel = await guild.fetch_channel(channel_id)
+    except (discord.errors.NotFound, discord.errors.Forbidden):
+        channel = None
+    _cache.put(guild.id, channel_id, channel)
+    return channel
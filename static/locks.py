@@ -0,0 +1,55 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import static.common as com
+
+# Waits longer than this are logged
+SLOW_WAIT_SECONDS = 1
+
+# key -> [asyncio.Lock, holders and waiters]. Entries are created on first use and dropped when the count reaches 0
+_locks = {}
+# kind -> {'acquired', 'contended', 'wait_total', 'wait_max'} in seconds
+stats = {}
+
+@asynccontextmanager
+async def hold(kind, *key):
+    key = (kind, *key)
+    entry = _locks.get(key)
+    if entry is None:
+        entry = _locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        lock = entry[0]
+        contended = lock.locked()
+        start = time.monotonic()
+        await lock.acquire()
+        waited = time.monotonic() - start
+        kind_stats = stats.setdefault(kind, {'acquired': 0, 'contended': 0, 'wait_total': 0.0, 'wait_max': 0.0})
+        kind_stats['acquired'] += 1
+        if contended:
+            kind_stats['contended'] += 1
+            kind_stats['wait_total'] += waited
+            kind_stats['wait_max'] = max(kind_stats['wait_max'], waited)
+        if waited > SLOW_WAIT_SECONDS:
+            print(f"{com.get_current_iso()} [{key[1]}] - Waited {waited:.2f}s for {kind} lock {key[2:]}", flush=True)
+        try:
+            yield
+        finally:
+            lock.release()
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _locks.pop(key, None)
+
+# Session and active roster changes of one guild. Take a user lock before a guild lock, never the other way round,
+# and never hold a guild lock across a view wait
+def guild(guild_id):
+    return hold('guild', int(guild_id))
+
+# One member's clock, urn and replacement queue changes
+def user(guild_id, user_id):
+    return hold('user', int(guild_id), int(user_id))
+
+def held() -> int:
+    return len(_locks)
@@ -0,0 +1,51 @@
+import os
+import asyncio
+
+import discord
+from static.ttlcache import TTLCache
+
+# Members fetched over REST are kept this long, misses for less so a member that rejoins shows up soon
+MEMBER_CACHE_TTL = int(os.getenv('MEMBER_CACHE_TTL', 600))
+MISSING_MEMBER_TTL = 60
+# Bound concurrent REST lookups so a dashboard refresh can not burst into a 429
+MAX_CONCURRENT_FETCHES = 2
+
+_cache = TTLCache(MEMBER_CACHE_TTL, MISSING_MEMBER_TTL)
+_fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+def remember(member: discord.Member):
+    _cache.put(member.guild.id, member.id, member)
+
+def invalidate(guild_id, user_id=None):
+    _cache.invalidate(guild_id, user_id)
+
+# Resolves a member from the interaction payload, then the gateway cache, then our TTL cache and only then REST
+# Returns None when the user is not in the guild
+async def get_member(guild: discord.Guild, user_id, ctx=None):
+    user_id = int(user_id)
+    if ctx is not None and ctx.author.id == user_id and isinstance(ctx.author, discord.Member):
+        return ctx.author
+    member = guild.get_member(user_id)
+    if member:
+        return member
+    found, member = _cache.get(guild.id, user_id)
+    if found:
+        return member
+    async with _fetch_semaphore:
+        # Another lookup for the same member may have finished while waiting
+        found, member = _cache.get(guild.id, user_id)
+        if found:
+            return member
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.errors.NotFound:
+            _cache.put(guild.id, user_id, None)
+            return None
+    remember(member)
+    return member
+
+async def get_display_name(guild: discord.Guild, user_id, default='placeholder', ctx=None) -> str:
+    member = await get_member(guild, user_id, ctx)
+    if member is None:
+        return default
+    return member.display_name
@@ -0,0 +1,74 @@
+import time
+import asyncio
+from collections import deque
+
+import discord
+import static.common as com
+
+# Discord allows two renames per channel every ten minutes
+RENAME_LIMIT = 2
+RENAME_WINDOW = 600
+
+# Queues channel renames and sends them within each channel's rename budget. Only the newest name asked for a
+# channel is kept, older pending names are replaced. drain() never waits on Discord, renames are sent as tasks.
+class RenameScheduler:
+    def __init__(self, limit=RENAME_LIMIT, window=RENAME_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._sent = {}
+        self._pending = {}
+        self._tasks = set()
+
+    def _history(self, channel_id) -> deque:
+        history = self._sent.setdefault(channel_id, deque())
+        cutoff = time.monotonic() - self.window
+        while history and history[0] <= cutoff:
+            history.popleft()
+        return history
+
+    def budget(self, channel_id) -> int:
+        return self.limit - len(self._history(channel_id))
+
+    # Seconds until the channel can be renamed again, 0 if it can be now
+    def wait_time(self, channel_id) -> float:
+        history = self._history(channel_id)
+        if len(history) < self.limit:
+            return 0
+        return max(history[0] + self.window - time.monotonic(), 0)
+
+    def pending(self, channel_id):
+        item = self._pending.get(channel_id)
+        return item[1] if item else None
+
+    def request(self, channel, name):
+        if channel.name == name:
+            self._pending.pop(channel.id, None)
+            return
+        self._pending[channel.id] = (channel, name)
+
+    def drain(self) -> int:
+        started = 0
+        for channel_id, (channel, name) in list(self._pending.items()):
+            if self.budget(channel_id) <= 0:
+                continue
+            del self._pending[channel_id]
+            if channel.name == name:
+                continue
+            self._history(channel_id).append(time.monotonic())
+            task = asyncio.create_task(self._send(channel, name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            started += 1
+        return started
+
+    async def _send(self, channel, name):
+        print(f'{com.get_current_iso()} [{channel.guild.id}] - Setting channel {channel.name} to {name}', flush=True)
+        try:
+            await channel.edit(name=name)
+        except discord.errors.HTTPException as err:
+            print(f'{com.get_current_iso()} [{channel.guild.id}] - Rename of {channel.id} to {name} failed: {err}', flush=True)
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        self._pending.clear()
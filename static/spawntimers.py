@@ -0,0 +1,154 @@
+import time
+import json
+import heapq
+import asyncio
+import itertools
+from dataclasses import dataclass
+
+import data.databaseapi as db
+import data.configapi as configapi
+import static.common as com
+
+MOBS_PATH = 'static/mobs.json'
+DEFAULT_MOB = 'Drusella Sathir'
+
+# Respawn defaults per mob, a guild overrides any of them with its mob_timers config value
+with open(MOBS_PATH, 'r', encoding='utf-8') as f:
+    default_mobs = json.load(f)
+
+@dataclass
+class MobTimer:
+    mob: str
+    short: str
+    tod: dict
+    # Camp opens camp_hours before the spawn, a mob with variance can spawn any time until expire
+    open_timestamp: float
+    spawn_timestamp: float
+    expire_timestamp: float
+
+    def events(self) -> list[tuple[str, float]]:
+        events = [('open', self.open_timestamp), ('spawn', self.spawn_timestamp)]
+        if self.expire_timestamp > self.spawn_timestamp:
+            events.append(('expire', self.expire_timestamp))
+        return events
+
+    # closed -> open -> window (variance mobs only) -> unknown
+    def state(self, now=None) -> str:
+        now = time.time() if now is None else now
+        if now < self.open_timestamp:
+            return 'closed'
+        if now < self.spawn_timestamp:
+            return 'open'
+        if now < self.expire_timestamp:
+            return 'window'
+        return 'unknown'
+
+    # Whole minutes until spawn, -1 once it has passed
+    def mins_till_spawn(self, now=None) -> int:
+        now = time.time() if now is None else now
+        mins = int((self.spawn_timestamp - now)/com.SECS_IN_MINUTE)
+        return mins if mins >= 0 else -1
+
+# guild_id -> {mob: MobTimer} for the latest ToD of each mob
+_timers = {}
+_loaded = set()
+# Min-heap of (due timestamp, seq, guild_id, mob, event, generation). A new ToD bumps the mob's generation
+# instead of searching the heap, the old entries are dropped when they reach the top
+_heap = []
+_generation = {}
+_seq = itertools.count()
+_wake = asyncio.Event()
+_listeners = []
+
+def mob_settings(guild_id, mob) -> dict:
+    settings = dict(default_mobs.get(mob) or default_mobs[DEFAULT_MOB])
+    if mob not in default_mobs:
+        settings['short'] = mob[:10]
+    overrides = (configapi.get_guild_config(guild_id) or {}).get('mob_timers') or {}
+    settings.update(overrides.get(mob, {}))
+    return settings
+
+def _build(guild_id, tod) -> MobTimer:
+    settings = mob_settings(guild_id, tod['mob'])
+    spawn = tod['tod_timestamp'] + settings['respawn_hours']*com.SECS_IN_HOUR
+    return MobTimer(tod['mob'], settings['short'], tod,
+                    spawn - settings['camp_hours']*com.SECS_IN_HOUR, spawn, spawn + settings['variance_hours']*com.SECS_IN_HOUR)
+
+def _schedule(guild_id, timer: MobTimer):
+    key = (guild_id, timer.mob)
+    generation = _generation.get(key, 0) + 1
+    _generation[key] = generation
+    _timers.setdefault(guild_id, {})[timer.mob] = timer
+    now = time.time()
+    for event, timestamp in timer.events():
+        if timestamp > now:
+            heapq.heappush(_heap, (timestamp, next(_seq), guild_id, timer.mob, event, generation))
+    _wake.set()
+
+async def load(guild_id, force=False):
+    if guild_id in _loaded and not force:
+        return
+    tods = await db.get_latest_tods(guild_id)
+    _loaded.add(guild_id)
+    for tod in tods:
+        _schedule(guild_id, _build(guild_id, tod))
+
+# Call after storing a ToD, it becomes the mob's latest
+async def set_tod(guild_id, tod) -> MobTimer:
+    await load(guild_id)
+    timer = _build(guild_id, tod)
+    _schedule(guild_id, timer)
+    return timer
+
+# Config subscriber, respawn settings changed so every timer of the guild is rebuilt
+def reschedule(guild_id, key=None):
+    if key is not None and key != 'mob_timers':
+        return
+    for timer in list(_timers.get(guild_id, {}).values()):
+        _schedule(guild_id, _build(guild_id, timer.tod))
+
+configapi.subscribe(reschedule)
+
+async def get_timer(guild_id, mob=DEFAULT_MOB) -> MobTimer | None:
+    await load(guild_id)
+    return _timers.get(guild_id, {}).get(mob)
+
+async def get_timers(guild_id) -> list[MobTimer]:
+    await load(guild_id)
+    return sorted(_timers.get(guild_id, {}).values(), key=lambda timer: timer.spawn_timestamp)
+
+# callback(guild_id, mob, event, timer) is called as each open, spawn and expire comes due
+def on_event(callback):
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+async def _fire(guild_id, mob, event):
+    timer = _timers[guild_id][mob]
+    for callback in list(_listeners):
+        try:
+            res = callback(guild_id, mob, event, timer)
+            if asyncio.iscoroutine(res):
+                await res
+        except Exception as err:
+            print(f"{com.get_current_iso()} [{guild_id}] - Spawn timer listener failed for {mob} {event}: {err}", flush=True)
+
+# Sleeps until the next due event, a new ToD wakes it early so an earlier event is never missed
+async def run():
+    while True:
+        while _heap and _heap[0][5] != _generation.get((_heap[0][2], _heap[0][3])):
+            heapq.heappop(_heap)
+        _wake.clear()
+        timeout = None
+        if _heap:
+            timeout = _heap[0][0] - time.time()
+            if timeout <= 0:
+                _, _, guild_id, mob, event, _ = heapq.heappop(_heap)
+                await _fire(guild_id, mob, event)
+                continue
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
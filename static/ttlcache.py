@@ -0,0 +1,33 @@
+import time
+
+# Per guild map of id -> object that expires entries after ttl seconds. None can be stored to remember that an
+# object is missing, those entries use missing_ttl so it shows up again soon after it is created
+class TTLCache:
+    def __init__(self, ttl, missing_ttl):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        # guild_id -> {id: (expires monotonic time, object or None)}
+        self._guilds = {}
+
+    # Returns (found, object), found is False when there is no live entry
+    def get(self, guild_id, item_id):
+        entries = self._guilds.get(int(guild_id))
+        hit = entries.get(int(item_id)) if entries else None
+        if hit is None:
+            return False, None
+        if hit[0] < time.monotonic():
+            entries.pop(int(item_id), None)
+            return False, None
+        return True, hit[1]
+
+    def put(self, guild_id, item_id, value):
+        ttl = self.missing_ttl if value is None else self.ttl
+        self._guilds.setdefault(int(guild_id), {})[int(item_id)] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, guild_id, item_id=None):
+        if item_id is None:
+            self._guilds.pop(int(guild_id), None)
+            return
+        entries = self._guilds.get(int(guild_id))
+        if entries:
+            entries.pop(int(item_id), None)
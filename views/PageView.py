@@ -0,0 +1,57 @@
+import discord
+
+# Pages through keyset queries one page per click. fetch_page(last_row) returns the page following
+# last_row, render(rows, page_number) returns the message content. Visited pages are kept so going
+# back does not query again.
+class PageView(discord.ui.View):
+    def __init__(self, author_id, first_page, fetch_page, render, page_size):
+        super().__init__(timeout=120)
+        self.author_id = author_id
+        self.fetch_page = fetch_page
+        self.render = render
+        self.page_size = page_size
+        self.pages = [first_page]
+        self.page = 0
+        self.update_buttons()
+
+    def content(self):
+        return self.render(self.pages[self.page], self.page+1)
+
+    def update_buttons(self):
+        last_page = self.page == len(self.pages)-1 and len(self.pages[self.page]) < self.page_size
+        self.previous_button_callback.disabled = self.page == 0
+        self.next_button_callback.disabled = last_page
+
+    async def interaction_check(self, interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message(content='Only the command author can page this', ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        for child in self.children:
+            child.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except (discord.errors.NotFound, AttributeError):
+            return
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previous_button_callback(self, button, interaction):
+        self.page = max(self.page-1, 0)
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.primary)
+    async def next_button_callback(self, button, interaction):
+        if self.page == len(self.pages)-1:
+            rows = await self.fetch_page(self.pages[self.page][-1])
+            if not rows:
+                # Previous page happened to end exactly at the last row
+                self.next_button_callback.disabled = True
+                await interaction.response.edit_message(view=self)
+                return
+            self.pages.append(rows)
+        self.page += 1
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.content(), view=self)